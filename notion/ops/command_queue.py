@@ -0,0 +1,107 @@
+"""Durable local queue for `command_runner.py serve` (SQLite, stdlib only).
+
+    commands  one row per command: body, idempotency key, status pending|running|done|failed
+    files     watched command files already enqueued (mtime, size, content hash)
+
+Delivery is at-least-once: rows are marked done only after their write succeeded, and rows left
+"running" by a crash go back to pending on the next start. An idempotency key (the command's
+"idempotency_key", or file path + body hash + occurrence for watched files) is unique, so a
+command that was already enqueued, or already applied, is never queued again.
+The connection is shared by the runner's worker threads (results are recorded per write).
+"""
+import json, time, sqlite3, threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idem TEXT UNIQUE,
+    source TEXT,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    enqueued_at REAL NOT NULL,
+    done_at REAL
+);
+CREATE INDEX IF NOT EXISTS commands_pending ON commands (status, not_before, id);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    sha TEXT NOT NULL
+);
+"""
+
+class CommandQueue:
+    def __init__(self, path: str) -> None:
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.lock = threading.RLock()  # one statement or transaction at a time on the shared connection
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+    def put_many(self, items: Iterable[Tuple[Dict[str, Any], str, Optional[str]]]) -> int:
+        """Enqueue (command, source, idempotency key) triples in one transaction; returns how many were new."""
+        now = time.time()
+        with self.lock, self.db:
+            before = self.db.total_changes
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR IGNORE INTO commands (idem, source, body, enqueued_at) VALUES (?, ?, ?, ?)",
+                ((idem, source, json.dumps(cmd, ensure_ascii=False), now) for cmd, source, idem in items))
+            return self.db.total_changes - before
+
+    def recover(self) -> int:
+        """Rows a previous process left running are delivered again."""
+        with self.lock:
+            return self.db.execute("UPDATE commands SET status = 'pending' WHERE status = 'running'").rowcount
+
+    def take(self, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """Oldest due pending commands, marked running."""
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            rows = self.db.execute(
+                "SELECT id, body FROM commands WHERE status = 'pending' AND not_before <= ? ORDER BY id LIMIT ?",
+                (time.time(), limit)).fetchall()
+            self.db.executemany("UPDATE commands SET status = 'running' WHERE id = ?", [(r[0],) for r in rows])
+        return [(rid, json.loads(body)) for rid, body in rows]
+
+    def finish(self, results: Iterable[Tuple[int, Optional[str]]]) -> None:
+        """(id, error or None) per taken command. Failures are retried with backoff up to MAX_ATTEMPTS."""
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            for rid, error in results:
+                if error is None:
+                    self.db.execute("UPDATE commands SET status = 'done', error = NULL, done_at = ? WHERE id = ?", (now, rid))
+                    continue
+                attempts = self.db.execute("SELECT attempts FROM commands WHERE id = ?", (rid,)).fetchone()[0] + 1
+                status = "failed" if attempts >= MAX_ATTEMPTS else "pending"
+                self.db.execute(
+                    "UPDATE commands SET status = ?, attempts = ?, error = ?, not_before = ? WHERE id = ?",
+                    (status, attempts, error, now + 5 * 2 ** attempts, rid))
+
+    def prune(self, days: float) -> int:
+        """Forget done commands older than `days` (their idempotency keys stop deduplicating)."""
+        with self.lock:
+            return self.db.execute("DELETE FROM commands WHERE status = 'done' AND done_at < ?",
+                                   (time.time() - days * 86400,)).rowcount
+
+    def file_state(self, path: str) -> Optional[Tuple[float, int, str]]:
+        with self.lock:
+            return self.db.execute("SELECT mtime, size, sha FROM files WHERE path = ?", (path,)).fetchone()
+
+    def set_file_state(self, path: str, mtime: float, size: int, sha: str) -> None:
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO files (path, mtime, size, sha) VALUES (?, ?, ?, ?)", (path, mtime, size, sha))
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.db.execute("SELECT status, COUNT(*) FROM commands GROUP BY status").fetchall())
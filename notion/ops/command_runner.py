@@ -1,7 +1,11 @@
-import os, sys, json, glob, re, time, csv
-from typing import Any, Dict, List, Optional
+import os, sys, json, glob, re, time, csv, hashlib, argparse, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
 from notion_client import Client
 from notion_client.helpers import iterate_paginated_api
+from extractors import plain_val
+from prefetch import prefetch
+from ratelimit import limited
 
 try:
     import yaml  # type: ignore
@@ -13,24 +17,43 @@ ROOT_PAGE_ID = os.environ.get("ROOT_PAGE_ID", "")
 if not NOTION_TOKEN:
     raise SystemExit("Missing NOTION_TOKEN")
 
+WORKERS = int(os.environ.get("COMMAND_WORKERS", "4"))
+WINDOW = int(os.environ.get("COMMAND_WINDOW", "1000"))
+
 client = Client(auth=NOTION_TOKEN)
+# every call from every worker shares one pace (see ratelimit.LIMITER)
+search = limited(client.search)
+retrieve_db = limited(client.databases.retrieve)
+update_db = limited(client.databases.update)
+query_db = limited(client.databases.query)
+create_page = limited(client.pages.create)
+update_page = limited(client.pages.update)
+retrieve_page = limited(client.pages.retrieve)
 
 def log(msg: str) -> None:
     print(f"[ops] {time.strftime('%H:%M:%S')} {msg}", flush=True)
 
 # ---------- Helpers ----------
+def db_title(obj: Dict[str, Any]) -> str:
+    t = obj.get("title", [])
+    if t and isinstance(t, list) and t[0].get("plain_text"):
+        return t[0]["plain_text"]
+    return ""
+
+# databases resolved in this process, by title (one search per title per run)
+_DBS: Dict[str, Optional[Dict[str, Any]]] = {}
+
 def find_db_by_title(title: str) -> Optional[Dict[str, Any]]:
+    if title in _DBS:
+        return _DBS[title]
     # search without filter, then pick databases
-    for obj in iterate_paginated_api(client.search, query=title):
-        if obj.get("object") == "database":
-            # extract title
-            db_title = ""
-            t = obj.get("title", [])
-            if t and isinstance(t, list) and t[0].get("plain_text"):
-                db_title = t[0]["plain_text"]
-            if db_title == title:
-                return obj
-    return None
+    found = None
+    for obj in iterate_paginated_api(search, query=title):
+        if obj.get("object") == "database" and db_title(obj) == title:
+            found = obj
+            break
+    _DBS[title] = found
+    return found
 
 def get_title_prop(db: Dict[str, Any]) -> Optional[str]:
     for name, meta in db.get("properties", {}).items():
@@ -38,9 +61,15 @@ def get_title_prop(db: Dict[str, Any]) -> Optional[str]:
             return name
     return None
 
-def ensure_props(db_id: str, props_needed: List[str], extra_types: Dict[str, str] = None) -> None:
-    """Ensure properties exist on database; default rich_text; title remains untouched."""
-    db = client.databases.retrieve(database_id=db_id)
+def ensure_props(db_id: str, props_needed: List[str], extra_types: Dict[str, str] = None,
+                 db: Optional[Dict[str, Any]] = None) -> None:
+    """Ensure properties exist on database; default rich_text; title remains untouched.
+
+    With `db` (an already retrieved database object) the schema is not fetched again, and the
+    object's properties are refreshed from the update response.
+    """
+    if db is None:
+        db = retrieve_db(database_id=db_id)
     existing = set(db.get("properties", {}).keys())
     to_add = [p for p in props_needed if p not in existing]
     if not to_add:
@@ -67,154 +96,752 @@ def ensure_props(db_id: str, props_needed: List[str], extra_types: Dict[str, str
             update_props[p] = {"relation": {"database_id": target, "type":"single_property"}}
         else:
             update_props[p] = {"rich_text": {}}
-    client.databases.update(database_id=db_id, properties=update_props)
+    updated = update_db(database_id=db_id, properties=update_props)
+    db["properties"] = updated.get("properties", db.get("properties", {}))
 
 def page_props_from_dict(title_prop: str, row: Dict[str, Any]) -> Dict[str, Any]:
     props: Dict[str, Any] = {}
     # Title
-    title_val = (
-        row.get("Name")
-        or row.get("Title")
-        or row.get("title")
-        or row.get(title_prop)
-        or ""
-    )
+    title_val = row_title(row, title_prop)
     if not title_val:
         raise SystemExit("Missing title value for page creation")
     props[title_prop] = {"title": [{"type": "text", "text": {"content": str(title_val)}}]}
     # Others
     for k, v in row.items():
-        if k == title_prop or k in ("Name", "Title", "title"):
+        if k == title_prop or k in TITLE_KEYS or k in ID_KEYS:
             continue
         if v is None:
             v = ""
         props[k] = {"rich_text": [{"type": "text", "text": {"content": str(v)}}]}
     return props
 
-def find_page_by(db_id: str, title_prop: str, row: Dict[str, Any]) -> Optional[str]:
-    """Find by prioritized keys: id, Key, Title/Name, else None."""
+TITLE_KEYS = ("Name", "Title", "title")
+ID_KEYS = ("id", "ID", "Id")  # address a page, never written as properties
+
+def row_title(row: Dict[str, Any], title_prop: Optional[str]) -> str:
+    return str(row.get("Name") or row.get("Title") or row.get("title") or (row.get(title_prop) if title_prop else "") or "")
+
+def row_key(row: Dict[str, Any]) -> str:
+    return str(row.get("Key") or row.get("key") or "")
+
+# key/title -> page id per database, loaded once per run and kept current by the actions
+_INDEX: Dict[str, Dict[str, Dict[str, str]]] = {}
+_INDEX_LOCK = threading.RLock()
+# page id -> [(map, key)] entries of the key/title/column maps that point at it (for index_remove)
+_OWNERS: Dict[str, List[Any]] = {}
+
+def _point(m: Dict[str, str], key: str, page_id: str) -> None:
+    """m.setdefault(key, page_id), remembering the entry so removing the page needs no scan."""
+    if key not in m:
+        m[key] = page_id
+        _OWNERS.setdefault(page_id, []).append((m, key))
+
+def page_index(db: Dict[str, Any], title_prop: Optional[str], columns: List[str] = ()) -> Dict[str, Dict[str, Any]]:
+    """{"key": {Key: page_id}, "title": {title: page_id}, "values": {page_id: {prop: text}}} from one paginated query.
+
+    filter_properties limits the response to Key, the title and `columns` (the properties the
+    batch updates, kept in "values" for diffing). When several pages share a key or title the
+    first one returned wins, as with the former page_size=1 queries.
+    """
+    with _INDEX_LOCK:
+        if db["id"] not in _INDEX:
+            _INDEX[db["id"]] = _load_index(db, title_prop, columns)
+        return _INDEX[db["id"]]
+
+def _load_index(db: Dict[str, Any], title_prop: Optional[str], columns: List[str]) -> Dict[str, Dict[str, Any]]:
+    props = db.get("properties", {})
+    wanted = list(dict.fromkeys(["Key", title_prop, *columns]))
+    ids = [props[p]["id"] for p in wanted if p in props and props[p].get("id")]
+    by_key: Dict[str, str] = {}
+    by_title: Dict[str, str] = {}
+    values: Dict[str, Dict[str, str]] = {}
+    for page in iterate_paginated_api(query_db, database_id=db["id"], page_size=100,
+                                      **({"filter_properties": ids} if ids else {})):
+        current = {name: plain_val(v) for name, v in page.get("properties", {}).items() if name in wanted}
+        if current.get("Key"):
+            _point(by_key, current["Key"], page["id"])
+        if title_prop and current.get(title_prop):
+            _point(by_title, current[title_prop], page["id"])
+        if columns:
+            values[page["id"]] = current
+    log(f"Indexed {db_title(db)}: {len(by_key)} key(s), {len(by_title)} title(s)")
+    return {"key": by_key, "title": by_title, "values": values}
+
+# value -> page id for explicit key columns ("key" in a command, bulk_upsert), per (database, column)
+_COLUMNS: Dict[Any, Dict[str, str]] = {}
+
+def column_index(db: Dict[str, Any], column: str) -> Dict[str, str]:
+    """One paginated query projected to `column`; first page wins on duplicate values."""
+    with _INDEX_LOCK:
+        if (db["id"], column) not in _COLUMNS:
+            meta = db.get("properties", {}).get(column)
+            by_value: Dict[str, str] = {}
+            if meta:  # a column the database does not have yet matches no page
+                for page in iterate_paginated_api(query_db, database_id=db["id"], page_size=100,
+                                                  **({"filter_properties": [meta["id"]]} if meta.get("id") else {})):
+                    v = plain_val(page.get("properties", {}).get(column, {}))
+                    if v:
+                        _point(by_value, v, page["id"])
+                log(f"Indexed {db_title(db)} by {column}: {len(by_value)} value(s)")
+            _COLUMNS[(db["id"], column)] = by_value
+        return _COLUMNS[(db["id"], column)]
+
+def index_add(batch: Dict[str, Any], row: Dict[str, Any], page_id: str) -> None:
+    # an index that is not loaded yet will pick the page up when it is
+    with _INDEX_LOCK:
+        for (db_id, column), m in _COLUMNS.items():
+            if db_id == batch["db"]["id"] and str(row.get(column) or ""):
+                _point(m, str(row[column]), page_id)
+        index = _INDEX.get(batch["db"]["id"])
+        if index is None:
+            return
+        if row_key(row):
+            _point(index["key"], row_key(row), page_id)
+        if row_title(row, batch["title_prop"]):
+            _point(index["title"], row_title(row, batch["title_prop"]), page_id)
+        if batch["title_prop"]:
+            index["values"][page_id] = fragments_text(page_props_from_dict(batch["title_prop"], row))
+
+def index_remove(batch: Dict[str, Any], page_id: str) -> None:
+    with _INDEX_LOCK:
+        for m, k in _OWNERS.pop(page_id, ()):
+            if m.get(k) == page_id:
+                del m[k]
+        _INDEX.get(batch["db"]["id"], {}).get("values", {}).pop(page_id, None)
+
+def fragments_text(props: Dict[str, Any]) -> Dict[str, str]:
+    """Plain text of the title/rich_text values page_props_from_dict builds, comparable with plain_val."""
+    return {name: "".join(x["text"]["content"] for x in frag[next(iter(frag))]) for name, frag in props.items()}
+
+# serve mode keeps indexes for minutes; values that would let an update skip a property are re-read
+FRESH_READS = False
+
+def current_values(batch: Dict[str, Any], page_id: str, fresh: bool = False) -> Dict[str, str]:
+    """A page's current property text: from the index when loaded with values, else (or when
+    `fresh`) one retrieve."""
+    index = page_index(batch["db"], batch["title_prop"], batch.get("columns", ()))
+    with _INDEX_LOCK:
+        known = index["values"].get(page_id)
+    if not fresh and known is not None and all(c in known for c in batch.get("columns", ())):
+        return known
+    page = retrieve_page(page_id=page_id)
+    current = {name: plain_val(v) for name, v in page.get("properties", {}).items()}
+    with _INDEX_LOCK:
+        index["values"][page_id] = current
+    return current
+
+def find_page_by(batch: Dict[str, Any], row: Dict[str, Any], key: Optional[str] = None) -> Optional[str]:
+    """Find by prioritized keys: id, Key, Title/Name, else None (answered from the page index).
+
+    With `key` (a command's explicit key column) only that column is matched.
+    """
     # 1) explicit id
     explicit = row.get("id") or row.get("ID") or row.get("Id")
     if explicit:
         return explicit
-
-    # 2) Key
-    key = row.get("Key") or row.get("key")
     if key:
-        q = {
-            "filter": {
-                "property": "Key",
-                "rich_text": {"equals": str(key)}
-            },
-            "page_size": 1
-        }
-        res = client.databases.query(database_id=db_id, **q)
-        for r in res.get("results", []):
-            return r["id"]
-
-    # 3) by title
-    ttl = row.get("Title") or row.get("Name") or row.get("title")
-    if ttl:
-        res = client.databases.query(
-            database_id=db_id,
-            filter={
-                "property": title_prop,
-                "title": {"equals": str(ttl)}
-            },
-            page_size=1
-        )
-        for r in res.get("results", []):
-            return r["id"]
-
-    return None
+        m = column_index(batch["db"], key)
+        with _INDEX_LOCK:
+            return m.get(str(row.get(key) or ""))
+    index = page_index(batch["db"], batch["title_prop"], batch.get("columns", ()))
+    # 2) Key, 3) title
+    with _INDEX_LOCK:
+        return index["key"].get(row_key(row)) or index["title"].get(row_title(row, None))
 
 # ---------- Actions ----------
-def action_add_page(cmd: Dict[str, Any]) -> None:
-    db_title = cmd["db"]
-    row = cmd["properties"]
-    db = find_db_by_title(db_title)
-    if not db:
-        raise SystemExit(f"Database not found: {db_title}")
-    title_prop = get_title_prop(db)
+def row_props(cmd: Dict[str, Any], title_prop: Optional[str]) -> List[str]:
+    """Non-title property names an add/update command writes."""
+    return [k for k in cmd.get("properties", {}) if k not in (title_prop,) + TITLE_KEYS + ID_KEYS]
+
+def action_add_page(batch: Dict[str, Any], cmd: Dict[str, Any]) -> None:
+    title_prop = batch["title_prop"]
     if not title_prop:
-        raise SystemExit(f"No title property in DB: {db_title}")
-    # ensure non-title props exist
-    others = [k for k in row.keys() if k not in (title_prop, "Name", "Title", "title")]
-    ensure_props(db["id"], others)
-    props = page_props_from_dict(title_prop, row)
-    client.pages.create(parent={"database_id": db["id"]}, properties=props)
-    log(f"ADDED page to {db_title}")
+        raise SystemExit(f"No title property in DB: {batch['title']}")
+    props = page_props_from_dict(title_prop, cmd["properties"])
+    page = create_page(parent={"database_id": batch["db"]["id"]}, properties=props)
+    index_add(batch, cmd["properties"], page["id"])
+    log(f"ADDED page to {batch['title']}")
 
-def action_update_page(cmd: Dict[str, Any]) -> None:
-    db_title = cmd["db"]
+def action_update_page(batch: Dict[str, Any], cmd: Dict[str, Any]) -> None:
     row = cmd["properties"]
-    db = find_db_by_title(db_title)
-    if not db:
-        raise SystemExit(f"Database not found: {db_title}")
-    title_prop = get_title_prop(db)
-    page_id = find_page_by(db["id"], title_prop or "Name", row)
+    title_prop = batch["title_prop"] or "Name"
+    page_id = find_page_by(batch, row, cmd.get("key"))
     if not page_id:
         raise SystemExit("Page to update not found")
-    # ensure props
-    others = [k for k in row.keys() if k not in (title_prop, "Name", "Title", "title")]
-    ensure_props(db["id"], others)
-    props = page_props_from_dict(title_prop or "Name", row)
-    client.pages.update(page_id=page_id, properties=props)
-    log(f"UPDATED page in {db_title}")
-
-def action_delete_page(cmd: Dict[str, Any]) -> None:
-    db_title = cmd["db"]
-    row = cmd.get("where", {})
-    db = find_db_by_title(db_title)
-    if not db:
-        raise SystemExit(f"Database not found: {db_title}")
-    title_prop = get_title_prop(db)
-    page_id = find_page_by(db["id"], title_prop or "Name", row)
+    props = page_props_from_dict(title_prop, row)
+    # only send what differs from the page; an already-applied update costs no write
+    current = current_values(batch, page_id)
+    new = fragments_text(props)
+    changed = {k: v for k, v in props.items() if current.get(k) != new[k]}
+    if FRESH_READS and len(changed) < len(props):
+        # the index may predate an edit made in Notion since; never skip on cached values alone
+        current = current_values(batch, page_id, fresh=True)
+        changed = {k: v for k, v in props.items() if current.get(k) != new[k]}
+    if not changed:
+        log(f"UNCHANGED page in {batch['title']}")
+        return
+    update_page(page_id=page_id, properties=changed)
+    with _INDEX_LOCK:
+        current.update({k: new[k] for k in changed})
+    log(f"UPDATED page in {batch['title']} ({', '.join(changed)})")
+
+def action_upsert_page(batch: Dict[str, Any], cmd: Dict[str, Any]) -> None:
+    """update_page when the key already names a page, else add_page; decided when it runs, against
+    the live index, so pages created earlier in the run are updated rather than created again."""
+    if find_page_by(batch, cmd["properties"], cmd.get("key")):
+        action_update_page(batch, cmd)
+    else:
+        action_add_page(batch, cmd)
+
+def action_delete_page(batch: Dict[str, Any], cmd: Dict[str, Any]) -> None:
+    page_id = find_page_by(batch, cmd.get("where", {}), cmd.get("key"))
     if not page_id:
         raise SystemExit("Page to delete not found")
-    client.pages.update(page_id=page_id, archived=True)
-    log(f"ARCHIVED page in {db_title}")
-
-def dispatch(cmd: Dict[str, Any]) -> None:
-    action = cmd.get("action")
-    if action == "add_page":
-        action_add_page(cmd)
-    elif action == "update_page":
-        action_update_page(cmd)
-    elif action == "delete_page":
-        action_delete_page(cmd)
+    update_page(page_id=page_id, archived=True)
+    index_remove(batch, page_id)
+    log(f"ARCHIVED page in {batch['title']}")
+
+ACTIONS = {
+    "add_page": action_add_page,
+    "update_page": action_update_page,
+    "upsert_page": action_upsert_page,
+    "delete_page": action_delete_page,
+}
+
+# actions that write a page's properties (and may need schema columns added)
+ROW_ACTIONS = ("add_page", "update_page", "upsert_page")
+
+def dispatch(batch: Dict[str, Any], cmd: Dict[str, Any]) -> None:
+    ACTIONS[cmd["action"]](batch, cmd)
+
+# ---------- Batch planning ----------
+def failure(i: int, cmd: Dict[str, Any], error: Any) -> Dict[str, Any]:
+    f = {"index": i, "action": cmd.get("action"), "db": cmd.get("db"), "error": str(error)}
+    if cmd.get("origin"):
+        f["origin"] = cmd["origin"]  # position in the bulk command it was expanded from
+    return f
+
+def plan(cmds: List[Dict[str, Any]], failures: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Group commands by database and prepare each database once.
+
+    Every database is resolved a single time and receives one schema update covering the union
+    of the properties its add/update commands write. Commands keep their file order within a
+    database as (position, command) pairs; commands that cannot run are added to `failures`.
+    """
+    groups: Dict[str, List[Any]] = {}
+    for i, cmd in enumerate(cmds):
+        if cmd.get("error"):
+            failures.append(failure(i, cmd, cmd["error"]))
+        elif cmd.get("action") not in ACTIONS:
+            failures.append(failure(i, cmd, f"Unknown action: {cmd.get('action')}"))
+        elif not cmd.get("db"):
+            failures.append(failure(i, cmd, "Missing db"))
+        else:
+            groups.setdefault(cmd["db"], []).append((i, cmd))
+    batches = []
+    for title, group in groups.items():
+        try:
+            db = find_db_by_title(title)
+            if not db:
+                raise SystemExit(f"Database not found: {title}")
+            title_prop = get_title_prop(db)
+            needed: Dict[str, None] = {}
+            for _, cmd in group:
+                if cmd["action"] in ROW_ACTIONS:
+                    needed.update(dict.fromkeys(row_props(cmd, title_prop)))
+            ensure_props(db["id"], list(needed), db=db)
+            # properties update commands write: their current values are indexed for diffing
+            columns = list(dict.fromkeys(
+                k for _, cmd in group if cmd["action"] in ("update_page", "upsert_page") for k in cmd.get("properties", {})
+                if k in db.get("properties", {})))
+            if title_prop and columns:
+                columns.append(title_prop)
+        except (Exception, SystemExit) as e:
+            failures.extend(failure(i, cmd, e) for i, cmd in group)
+            continue
+        batches.append({"title": title, "db": db, "title_prop": title_prop, "commands": group, "columns": columns})
+    return batches
+
+def target(batch: Dict[str, Any], cmd: Dict[str, Any]) -> Any:
+    """(logical address, resolved page id or None) of the page a command writes to.
+
+    The address is what the command names the page by (id, explicit key column, Key, else
+    title); the id is what that address points at when the batch is planned.
+    """
+    row = cmd.get("where", {}) if cmd["action"] == "delete_page" else cmd.get("properties", {})
+    page_id = find_page_by(batch, row, cmd.get("key")) if cmd["action"] != "add_page" else None
+    explicit = row.get("id") or row.get("ID") or row.get("Id")
+    if explicit:
+        address = f"id:{explicit}"
+    elif cmd.get("key"):
+        address = f"{cmd['key']}:{row.get(cmd['key']) or ''}"
     else:
-        raise SystemExit(f"Unknown action: {action}")
+        address = f"Key:{row_key(row)}" if row_key(row) else f"title:{row_title(row, batch['title_prop'])}"
+    return address, page_id
+
+def partitions(keyed: List[Any]) -> List[List[Any]]:
+    """Group (nodes, item) pairs whose node sets overlap (union-find), keeping item order per group.
+
+    A command's nodes are its logical address and its resolved page id, so commands naming the
+    same key always share a partition even when the key moves to another page mid-batch (archive,
+    then re-add), and commands reaching one page through different keys do too.
+    """
+    parent: Dict[Any, Any] = {}
+
+    def find(x: Any) -> Any:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for nodes, _ in keyed:
+        for n in nodes[1:]:
+            parent[find(n)] = find(nodes[0])
+    groups: Dict[Any, List[Any]] = {}
+    for nodes, item in keyed:
+        groups.setdefault(find(nodes[0]), []).append(item)
+    return list(groups.values())
+
+def coalesce(items: List[Any]) -> List[Any]:
+    """Merge one page's (batch, position, command) sequence into the fewest writes.
+
+    Successive updates merge into one (later values win), an add followed by updates becomes a
+    single add, and an archive drops the updates pending before it (an add followed by an archive
+    drops both). Upserts merge like updates, and a run containing one stays an upsert unless it
+    starts with an add; an upsert is kept before an archive, since it may have created the page.
+    Returns (batch, [positions], command) triples in order.
+    """
+    out: List[Any] = []
+    pending = None  # [batch, positions, merged command] not written yet
+    for batch, i, cmd in items:
+        action = cmd["action"]
+        if action in ("update_page", "upsert_page") and pending is not None:
+            first = pending[2]["action"]
+            merged = dict(pending[2], properties={**pending[2]["properties"], **cmd.get("properties", {})},
+                          action=first if first != "update_page" else action)
+            pending = [batch, pending[1] + [i], merged]
+            continue
+        if action == "delete_page" and pending is not None:
+            if pending[2]["action"] == "add_page":
+                pending = None  # never created, nothing to archive
+                continue
+            if pending[2]["action"] == "upsert_page":
+                out.append(tuple(pending))
+                out.append((batch, [i], cmd))
+            else:
+                out.append((batch, pending[1] + [i], cmd))
+            pending = None
+            continue
+        if pending is not None:
+            out.append(tuple(pending))
+        pending = [batch, [i], cmd] if action in ROW_ACTIONS else None
+        if pending is None:
+            out.append((batch, [i], cmd))
+    if pending is not None:
+        out.append(tuple(pending))
+    return out
+
+def run_batch(cmds: List[Dict[str, Any]], workers: int = WORKERS,
+              on_applied: Optional[Callable[[List[int]], None]] = None) -> List[Dict[str, Any]]:
+    """Run a command batch; returns the failures (empty when everything was applied).
+
+    `on_applied(positions)` is called from the worker right after each successful write, with
+    the positions of the commands that write covered (serve records them as done at once).
+
+    Commands are partitioned by target page (see partitions()). A partition runs in file order on one worker,
+    so operations on the same page never reorder; different pages run in parallel, paced by
+    the shared rate limiter. Each partition is coalesced first, so a page gets at most one
+    write per run of adds/updates. After a failure the rest of that page's commands are
+    skipped, other pages carry on.
+    """
+    failures: List[Dict[str, Any]] = []
+    keyed: List[Any] = []
+    for batch in plan(cmds, failures):
+        # explicit key columns in use: a command carrying a value in one of them shares that
+        # address too (an add_page of Term=x and an upsert keyed on Term=x hit the same page)
+        key_columns = list(dict.fromkeys(cmd["key"] for _, cmd in batch["commands"] if cmd.get("key")))
+        for i, cmd in batch["commands"]:
+            try:
+                address, page_id = target(batch, cmd)
+            except (Exception, SystemExit) as e:
+                failures.append(failure(i, cmd, e))
+                continue
+            row = cmd.get("where", {}) if cmd["action"] == "delete_page" else cmd.get("properties", {})
+            nodes = [(batch["db"]["id"], address)]
+            nodes += [(batch["db"]["id"], f"{c}:{row[c]}") for c in key_columns if row.get(c)]
+            nodes += [("page", page_id)] if page_id else []
+            keyed.append((nodes, (batch, i, cmd)))
+    writes = [coalesce(items) for items in partitions(keyed)]
+    n_writes = sum(len(w) for w in writes)
+    if n_writes < len(cmds) - len(failures):
+        log(f"Coalesced {len(cmds) - len(failures)} command(s) into {n_writes} write(s)")
+    lock = threading.Lock()
+
+    def run_part(items: List[Any]) -> None:
+        failed = None
+        for batch, positions, cmd in items:
+            if failed is not None:
+                err = f"skipped: command {failed} on the same page failed"
+            else:
+                try:
+                    dispatch(batch, cmd)
+                    if on_applied is not None:
+                        on_applied(positions)
+                    continue
+                except (Exception, SystemExit) as e:
+                    failed, err = positions[-1], e
+                    log(f"FAILED #{positions} {cmd.get('action')} in {batch['title']}: {e}")
+            with lock:
+                failures.extend(failure(i, cmds[i], err) for i in positions)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        list(ex.map(run_part, writes))
+    failures.sort(key=lambda f: f["index"])
+    return failures
+
+# ---------- Bulk actions ----------
+def iter_csv(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        yield from csv.DictReader(f)
+
+def expand_bulk_upsert(cmd: Dict[str, Any], origin: int) -> Iterator[Dict[str, Any]]:
+    """{"action": "bulk_upsert", "db", "key": column, "rows": [...] | "csv": path}
+
+    One upsert_page per row, matched on the key column when it runs (not here: expansion runs
+    ahead of execution). Rows repeating a key share a partition and coalesce into one write.
+    """
+    title, column = cmd["db"], cmd.get("key", "Key")
+    if not find_db_by_title(title):
+        raise SystemExit(f"Database not found: {title}")
+    rows = cmd["rows"] if "rows" in cmd else iter_csv(cmd["csv"])
+    for n, row in enumerate(rows):
+        base = {"action": "upsert_page", "db": title, "key": column, "properties": row,
+                "origin": {"command": origin, "row": n}}
+        yield base if str(row.get(column) or "") else dict(base, error=f"Row without {column}")
+
+def expand_archive_where(cmd: Dict[str, Any], origin: int) -> Iterator[Dict[str, Any]]:
+    """{"action": "archive_where", "db", "filter": <databases.query filter>}: one delete_page per match."""
+    title = cmd["db"]
+    if not cmd.get("filter"):
+        raise SystemExit("archive_where needs a filter")
+    db = find_db_by_title(title)
+    if not db:
+        raise SystemExit(f"Database not found: {title}")
+    title_prop = get_title_prop(db)
+    meta = db.get("properties", {}).get(title_prop or "", {})
+    # ids are collected before archiving anything, so the filtered result set does not shift under the cursor
+    ids = [page["id"] for page in iterate_paginated_api(
+        query_db, database_id=db["id"], filter=cmd["filter"], page_size=100,
+        **({"filter_properties": [meta["id"]]} if meta.get("id") else {}))]
+    log(f"archive_where {title}: {len(ids)} page(s) match")
+    for n, page_id in enumerate(ids):
+        yield {"action": "delete_page", "db": title, "where": {"id": page_id}, "origin": {"command": origin, "row": n}}
+
+BULK_ACTIONS = {
+    "bulk_upsert": expand_bulk_upsert,
+    "archive_where": expand_archive_where,
+}
+
+class Drain:
+    """Stream marker before a bulk command: its expansion waits until `done` is set, i.e. until
+    every command before it has run (run_stream sets it), so its reads see those writes."""
+    def __init__(self) -> None:
+        self.done = threading.Event()
+
+def expand(cmds: Iterable[Dict[str, Any]]) -> Iterator[Any]:
+    """Replace bulk commands by the page commands they stand for (lazily, rows are streamed).
+
+    A Drain is yielded ahead of each bulk command, which is expanded once it is set.
+    """
+    for i, cmd in enumerate(cmds):
+        fn = BULK_ACTIONS.get(cmd.get("action"))
+        if fn is None:
+            yield cmd
+            continue
+        drain = Drain()
+        yield drain
+        drain.done.wait()
+        try:
+            yield from fn(cmd, i)
+        except (Exception, SystemExit) as e:
+            yield dict(cmd, error=str(e), origin={"command": i})
 
 # ---------- Entry ----------
-def load_file(path: str) -> List[Dict[str, Any]]:
+def iter_commands(path: str) -> Iterator[Dict[str, Any]]:
+    """Commands from a file, parsed incrementally.
+
+    .jsonl/.ndjson: one command per line. .yml/.yaml: one or more documents (each an object or a
+    list of objects), read document by document. .json: an object or a list (read whole).
+    """
     with open(path, "r", encoding="utf-8") as f:
-        text = f.read()
-    if path.endswith(".json"):
-        data = json.loads(text)
-    else:
-        if yaml is None:
-            raise SystemExit("PyYAML not installed")
-        data = yaml.safe_load(text)
-    # allow single object or list
-    if isinstance(data, dict):
-        return [data]
-    elif isinstance(data, list):
-        return data
-    else:
-        raise SystemExit("Command file must be an object or a list of objects")
+        if path.endswith((".jsonl", ".ndjson")):
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        raise SystemExit(f"{path}:{n}: invalid JSON ({e})")
+            return
+        if path.endswith(".json"):
+            docs: Iterable[Any] = [json.load(f)]
+        else:
+            if yaml is None:
+                raise SystemExit("PyYAML not installed")
+            docs = yaml.safe_load_all(f)
+        for data in docs:
+            # allow single object or list
+            if isinstance(data, dict):
+                yield data
+            elif isinstance(data, list):
+                yield from data
+            elif data is not None:
+                raise SystemExit("Command file must be an object or a list of objects")
+
+def load_file(path: str) -> List[Dict[str, Any]]:
+    return list(iter_commands(path))
+
+def _chunks(cmds: Iterable[Any], size: int) -> Iterator[Any]:
+    """Lists of up to `size` commands; a Drain ends the current list and is passed through."""
+    buf: List[Dict[str, Any]] = []
+    for cmd in cmds:
+        if isinstance(cmd, Drain):
+            if buf:
+                yield buf
+                buf = []
+            yield cmd
+            continue
+        buf.append(cmd)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+def windows(cmds: Iterable[Any], size: int) -> Iterator[Any]:
+    """Fixed-size windows of a command stream, parsed one window ahead on a background thread.
+
+    prefetch holds a single window, so parsing stops while the executor is behind (backpressure)
+    and memory stays at ~2 windows however large the file is.
+    """
+    return prefetch(_chunks(cmds, size))
+
+def run_stream(cmds: Iterable[Dict[str, Any]], workers: int = WORKERS, window: int = WINDOW) -> List[Dict[str, Any]]:
+    """run_batch() over consecutive windows; a window finishes before the next starts, so file
+    order per page holds across windows. A bulk command starts a new window and is expanded only
+    after the windows before it ran (see Drain). Failure positions are relative to the whole stream.
+
+    When the stream itself breaks (unreadable file, parse error) the windows before it stay
+    applied and their failures are returned, followed by one failure with index None for the
+    error; the rest of the stream is not run.
+    """
+    failures: List[Dict[str, Any]] = []
+    offset = 0
+    started = time.monotonic()
+    try:
+        for w in windows(expand(cmds), window):
+            if isinstance(w, Drain):
+                w.done.set()  # the windows before it have run: let the bulk command expand
+                continue
+            failures.extend(dict(f, index=f["index"] + offset) for f in run_batch(w, workers))
+            offset += len(w)
+            if offset > len(w):  # progress for multi-window runs (large files, bulk actions)
+                elapsed = time.monotonic() - started
+                log(f"Progress: {offset} command(s), {len(failures)} failed, {offset / max(elapsed, 1e-9):.1f}/s")
+    except (Exception, SystemExit) as e:
+        log(f"FAILED after {offset} command(s): {e}")
+        failures.append({"index": None, "action": None, "db": None, "error": str(e)})
+    elapsed = time.monotonic() - started
+    log(f"Done: {offset} command(s) in {elapsed:.1f}s ({offset / max(elapsed, 1e-9):.1f}/s), {len(failures)} failed")
+    return failures
+
+# ---------- Serve ----------
+QUEUE_DB = os.environ.get("COMMAND_QUEUE_DB", ".command_queue.sqlite")
+WATCH_DIR = os.environ.get("COMMAND_WATCH_DIR", "content/commands")
+POLL = float(os.environ.get("COMMAND_POLL", "1"))
+CACHE_TTL = float(os.environ.get("COMMAND_CACHE_TTL", "300"))  # seconds before indexes are reloaded
+KEEP_DAYS = float(os.environ.get("COMMAND_QUEUE_KEEP_DAYS", "30"))
+COMMAND_EXTS = (".json", ".jsonl", ".ndjson", ".yml", ".yaml")
+
+def reset_caches() -> None:
+    """Drop resolved databases and page indexes so edits made outside this process are seen."""
+    with _INDEX_LOCK:
+        _DBS.clear()
+        _INDEX.clear()
+        _COLUMNS.clear()
+        _OWNERS.clear()
+
+def idem_key(cmd: Dict[str, Any], default: Optional[str]) -> Optional[str]:
+    return str(cmd["idempotency_key"]) if cmd.get("idempotency_key") else default
+
+def enqueue_file(q: Any, path: str) -> int:
+    """Queue a file's commands, each keyed by path + hash of its body + how many identical bodies
+    precede it in the file. Appending to or editing a file therefore only queues the commands
+    that are new; those already queued or applied keep their keys."""
+    seen: Dict[str, int] = {}
+
+    def keyed(cmd: Dict[str, Any]) -> Any:
+        body = hashlib.sha256(json.dumps(cmd, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        n = seen[body] = seen.get(body, -1) + 1
+        return cmd, f"{path}#{body[:12]}.{n}", idem_key(cmd, f"{path}:{body}:{n}")
+
+    return q.put_many(keyed(cmd) for cmd in iter_commands(path))
+
+def scan(q: Any, root: str) -> None:
+    """Enqueue command files under `root` that are new or whose content changed since the last scan."""
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(root, "**", "*"), recursive=True)):
+        if not path.endswith(COMMAND_EXTS) or not os.path.isfile(path):
+            continue
+        st = os.stat(path)
+        known = q.file_state(path)
+        if known and (known[0], known[1]) == (st.st_mtime, st.st_size):
+            continue
+        if now - st.st_mtime < 1:
+            continue  # possibly still being written; picked up on a later scan
+        with open(path, "rb") as f:
+            sha = hashlib.sha256(f.read()).hexdigest()
+        if not known or known[2] != sha:
+            try:
+                log(f"Queued {enqueue_file(q, path)} command(s) from {path}")
+            except (Exception, SystemExit) as e:
+                log(f"FAILED to read {path}: {e}")  # retried once the file changes again
+        q.set_file_state(path, st.st_mtime, st.st_size, sha)
+
+def process(q: Any, items: List[Any], workers: int) -> int:
+    """Run taken (id, command) rows and record the outcome of each; returns the failure count.
+
+    Page commands run as one batch, and each write is recorded as done as soon as it is applied,
+    so a crash only re-runs writes that were in flight. A bulk command runs on its own (it
+    expands to many page commands) and fails as a whole when any of its rows fail. Order
+    between them is kept.
+    """
+    failures = 0
+    segment: List[Any] = []
+
+    def flush() -> None:
+        nonlocal failures
+        if not segment:
+            return
+        ids = [rid for rid, _ in segment]
+        finished = set()
+
+        def applied(positions: List[int]) -> None:
+            q.finish((ids[n], None) for n in positions)
+            finished.update(positions)
+
+        failed = {f["index"]: f["error"] for f in run_batch([cmd for _, cmd in segment], workers, applied)}
+        # failures, and commands coalesced away (an add archived in the same batch) are left
+        q.finish((rid, failed.get(n)) for n, rid in enumerate(ids) if n not in finished)
+        failures += len(failed)
+        segment.clear()
+
+    for rid, cmd in items:
+        if cmd.get("action") not in BULK_ACTIONS:
+            segment.append((rid, cmd))
+            continue
+        flush()
+        try:
+            failed = run_stream([cmd], workers)
+            error = f"{len(failed)} row(s) failed, first: {failed[0]['error']}" if failed else None
+        except (Exception, SystemExit) as e:
+            error = str(e)
+        q.finish([(rid, error)])
+        failures += error is not None
+    flush()
+    return failures
+
+def serve(args: Any) -> None:
+    """Process queued commands continuously; files under --watch are enqueued as they appear.
+
+    Databases, page indexes and the HTTP client stay warm between commands (indexes are reloaded
+    every COMMAND_CACHE_TTL seconds, and an update re-reads the page before skipping any property
+    the index says is unchanged). Delivery is at-least-once: each write is recorded as soon as
+    it is applied, and only a crash between a write and its record runs that command again;
+    adds should carry an "idempotency_key" when they are enqueued from several places.
+    """
+    global FRESH_READS
+    FRESH_READS = True
+    from command_queue import CommandQueue
+    q = CommandQueue(args.queue)
+    recovered = q.recover()
+    if recovered:
+        log(f"Re-queued {recovered} command(s) left running by a previous process")
+    q.prune(KEEP_DAYS)
+    log(f"Serving {args.queue}" + (f", watching {args.watch}" if args.watch else ""))
+    loaded = time.monotonic()
+    try:
+        while True:
+            if time.monotonic() - loaded > CACHE_TTL:
+                reset_caches()
+                loaded = time.monotonic()
+            if args.watch and os.path.isdir(args.watch):
+                scan(q, args.watch)
+            items = q.take(args.window)
+            if items:
+                failed = process(q, items, args.workers)
+                log(f"Processed {len(items)} command(s), {failed} failed; queue: {q.stats()}")
+            elif args.once:
+                break
+            else:
+                time.sleep(args.poll)
+    except KeyboardInterrupt:
+        log("Stopped")
+    finally:
+        q.close()
+
+def enqueue(args: Any) -> None:
+    from command_queue import CommandQueue
+    q = CommandQueue(args.queue)
+    try:
+        for path in args.files:
+            if path == "-":  # JSON lines on stdin
+                cmds = (json.loads(line) for line in sys.stdin if line.strip())
+                n = q.put_many((cmd, "stdin", idem_key(cmd, None)) for cmd in cmds)
+            else:
+                n = enqueue_file(q, path)
+            log(f"Queued {n} command(s) from {path}")
+    finally:
+        q.close()
 
 def main():
+    ap = argparse.ArgumentParser(description="Run Notion command files (paths on stdin).")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="pages written in parallel")
+    ap.add_argument("--window", type=int, default=WINDOW, help="commands planned and executed together")
+    ap.add_argument("--report", default=os.environ.get("COMMAND_REPORT", ""), help="write failures as JSON to this file")
+    ap.add_argument("--queue", default=QUEUE_DB, help="SQLite queue used by serve/enqueue")
+    sub = ap.add_subparsers(dest="mode")
+    s = sub.add_parser("serve", help="process the queue continuously, enqueueing watched command files")
+    s.add_argument("--watch", default=WATCH_DIR, help="directory polled for command files ('' to disable)")
+    s.add_argument("--poll", type=float, default=POLL, help="seconds between polls when idle")
+    s.add_argument("--once", action="store_true", help="exit when the queue is drained")
+    e = sub.add_parser("enqueue", help="add command files ('-' for JSON lines on stdin) to the queue")
+    e.add_argument("files", nargs="+")
+    args = ap.parse_args()
+    if args.mode == "serve":
+        return serve(args)
+    if args.mode == "enqueue":
+        return enqueue(args)
     changed = sys.stdin.read().strip().splitlines()
     files = [p for p in changed if p.strip()]
     if not files:
         log("No command files to run.")
         return
     log(f"Running commands for: {files}")
+    report: List[Dict[str, Any]] = []
     for path in files:
-        cmds = load_file(path)
-        for cmd in cmds:
-            dispatch(cmd)
+        try:
+            report.extend({"file": path, **f} for f in run_stream(iter_commands(path), args.workers, args.window))
+        except (Exception, SystemExit) as e:  # anything run_stream did not report itself
+            report.append({"file": path, "index": None, "action": None, "db": None, "error": str(e)})
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report:
+        for f in report:
+            log(f"FAILED {f['file']}#{f['index']} {f['action']} {f['db']}: {f['error']}")
+        raise SystemExit(f"{len(report)} command(s) failed")
 
 if __name__ == "__main__":
     main()
@@ -1,16 +1,36 @@
-import os, csv, time
-from typing import Any, Dict, List
+import os, csv, json, time, fnmatch, argparse, threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
 from notion_client import Client
 from notion_client.helpers import iterate_paginated_api
+from extractors import compile_row
+from prefetch import prefetch
+from ratelimit import limited
+from sinks import SINKS
 
 NOTION_TOKEN = os.environ.get("NOTION_TOKEN", "")
+ROOT_PAGE_ID = os.environ.get("ROOT_PAGE_ID", "")
 if not NOTION_TOKEN:
     raise SystemExit("Missing NOTION_TOKEN")
 
-OUT_DIR = "content/databases/exports"
+OUT_DIR = os.environ.get("EXPORT_DIR", "content/databases/exports")
+STATE_FILE = os.environ.get("EXPORT_STATE_FILE", os.path.join(OUT_DIR, ".export_state.json"))
+FULL_EVERY_DAYS = float(os.environ.get("EXPORT_FULL_EVERY_DAYS", "7"))
+WORKERS = int(os.environ.get("EXPORT_WORKERS", "4"))
+ID_COL = "_page_id"
 os.makedirs(OUT_DIR, exist_ok=True)
 
 client = Client(auth=NOTION_TOKEN)
+# every call from every export thread shares one pace (see ratelimit.LIMITER)
+query_db = limited(client.databases.query)
+retrieve_db = limited(client.databases.retrieve)
+list_children = limited(client.blocks.children.list)
+search = limited(client.search)
+
+# blocks that can hold child pages/databases and are worth descending into
+CONTAINER_TYPES = {"child_page", "column_list", "column", "toggle", "synced_block"}
 
 def log(m: str) -> None:
     print(f"[export] {time.strftime('%H:%M:%S')} {m}", flush=True)
@@ -21,57 +41,255 @@ def db_title(obj: Dict[str, Any]) -> str:
         return t[0]["plain_text"]
     return ""
 
-def plain_val(p: Dict[str, Any]) -> str:
-    t = p.get("type")
-    v = p.get(t)
-    if t in ("title", "rich_text"):
-        if isinstance(v, list) and v:
-            return "".join([x.get("plain_text","") for x in v])
-        return ""
-    if t == "number":
-        return "" if v is None else str(v)
-    if t == "select":
-        return v.get("name","") if v else ""
-    if t == "multi_select":
-        return ",".join([x.get("name","") for x in (v or [])])
-    if t == "date":
-        if not v: return ""
-        start = v.get("start","")
-        end = v.get("end","")
-        return f"{start}..{end}" if end else start
-    if t == "people":
-        return ",".join([x.get("name","") for x in (v or [])])
-    if t == "relation":
-        return ",".join([x.get("id","") for x in (v or [])])
-    return ""
+def load_state() -> Dict[str, Any]:
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-def export_db(db: Dict[str, Any]) -> None:
-    db_id = db["id"]
-    title = db_title(db) or db_id[:8]
-    rows: List[Dict[str,str]] = []
+def save_state(state: Dict[str, Any]) -> None:
+    # EXPORT_STATE_FILE may live outside OUT_DIR (the backup keeps it next to the snapshots)
+    os.makedirs(os.path.dirname(STATE_FILE) or ".", exist_ok=True)
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, STATE_FILE)
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+def _watermark(started: str) -> str:
+    # last_edited_time is minute-granular in Notion: step back to the previous minute so nothing slips between runs
+    at = datetime.fromisoformat(started.replace("Z", "+00:00")).replace(second=0, microsecond=0) - timedelta(minutes=1)
+    return at.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+def _due_for_full(st: Dict[str, Any]) -> bool:
+    last = st.get("full_at")
+    if not last:
+        return True
+    at = datetime.fromisoformat(last.replace("Z", "+00:00"))
+    return datetime.now(timezone.utc) - at >= timedelta(days=FULL_EVERY_DAYS)
 
+def mergeable(path: str) -> bool:
+    """True if an existing export can be merged into (present and in the page-id format)."""
+    if not os.path.exists(path):
+        return False
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return ID_COL in (csv.DictReader(f).fieldnames or [])
+
+def _pages(fn, **kwargs) -> Iterator[List[Dict[str, Any]]]:
+    cursor = None
+    while True:
+        resp = fn(**kwargs, **({"start_cursor": cursor} if cursor else {}))
+        yield resp.get("results", [])
+        if not resp.get("has_more"):
+            return
+        cursor = resp.get("next_cursor")
+
+def iter_batches(fn, **kwargs) -> Iterator[List[Dict[str, Any]]]:
+    """Yield the `results` of each page of a paginated endpoint.
+
+    The next page is fetched on a background thread (see prefetch) while the caller
+    serializes the current one; at most ~2 batches are held.
+    """
+    return prefetch(_pages(fn, **kwargs))
+
+@contextmanager
+def atomic_csv(path: str, fieldnames: List[str]):
+    """DictWriter on a temp file next to `path`; renamed over it only if the block completes."""
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=fieldnames)
+            w.writeheader()
+            yield w
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def load_spec(path: str) -> Dict[str, Dict[str, Any]]:
+    """Per-database export spec keyed by title: {"columns": [...], "filter": {...}, "sorts": [...]}."""
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def build_query(db: Dict[str, Any], spec: Dict[str, Any]):
+    """(projected properties, databases.query kwargs) with the spec's columns/filter/sorts pushed down to Notion."""
     props = db.get("properties", {})
+    query: Dict[str, Any] = {"database_id": db["id"], "page_size": 100}
+    cols = spec.get("columns")
+    if cols:
+        unknown = [c for c in cols if c not in props]
+        if unknown:
+            log(f"{db_title(db)}: ignoring unknown columns {unknown}")
+        props = {c: props[c] for c in cols if c in props}
+        # filter_properties takes property ids; Notion then returns only these values per page
+        query["filter_properties"] = [meta["id"] for meta in props.values() if meta.get("id")]
+    if spec.get("filter"):
+        query["filter"] = spec["filter"]
+    if spec.get("sorts"):
+        query["sorts"] = spec["sorts"]
+    return props, query
+
+def file_names(dbs: List[Dict[str, Any]]) -> Dict[str, str]:
+    """{database id: output file stem}: the title, suffixed with the id when several databases share it."""
+    titles = [db_title(db) or db["id"][:8] for db in dbs]
+    return {db["id"]: t if titles.count(t) == 1 else f"{t}__{db['id'].replace('-', '')[:8]}"
+            for db, t in zip(dbs, titles)}
+
+def export_typed(db: Dict[str, Any], fmt: str, spec: Optional[Dict[str, Any]] = None, name: Optional[str] = None) -> None:
+    """Full export through a typed sink (Parquet / JSONL) plus its schema sidecar."""
+    title = db_title(db) or db["id"][:8]
+    props, query = build_query(db, spec or {})
+    with SINKS[fmt](OUT_DIR, name or title, db["id"], props) as sink:
+        for batch in iter_batches(query_db, **query):
+            sink.write(batch)
+    log(f"Exported {title} -> {sink.path} ({sink.rows} rows, {fmt})")
+
+def export_db(db: Dict[str, Any], state: Optional[Dict[str, Any]] = None, fmt: str = "csv",
+              spec: Optional[Dict[str, Any]] = None, name: Optional[str] = None) -> None:
+    """Full export, or (with state) an incremental one that only fetches pages edited since the last run.
+
+    Rows are streamed to disk batch by batch. Incremental runs hold only the changed rows and
+    stream the previous CSV through, replacing them by page id. Deleted/archived pages never show
+    up in an incremental query, so a full export is forced every FULL_EVERY_DAYS, when the schema
+    changes, or when there is no mergeable CSV yet. `name` is the file stem (default: the title).
+    """
+    if fmt != "csv":
+        return export_typed(db, fmt, spec, name)
+    db_id = db["id"]
+    title = db_title(db) or db_id[:8]
+    props, query = build_query(db, spec or {})
+    query_sig = json.dumps({k: query.get(k) for k in ("filter", "sorts")}, sort_keys=True)
     prop_names = list(props.keys())
+    page_row = compile_row(props, ID_COL)  # extractor per column, resolved once from the schema
+    fieldnames = [ID_COL] + prop_names
+    path = os.path.join(OUT_DIR, f"{name or title}.csv")
+
+    st = state.setdefault(db_id, {}) if state is not None else {}
+    incremental = bool(
+        state is not None and st.get("hwm") and not _due_for_full(st)
+        and st.get("columns") == prop_names and st.get("query") == query_sig and mergeable(path)
+    )
+
+    started = _now()
+    if incremental:
+        since = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": st["hwm"]}}
+        query["filter"] = {"and": [query["filter"], since]} if query.get("filter") else since
+    fetched = written = 0
+    if incremental:
+        changed: Dict[str, Dict[str, str]] = {}
+        for batch in iter_batches(query_db, **query):
+            for page in batch:
+                changed[page["id"]] = page_row(page)
+            fetched += len(batch)
+        if changed:
+            with open(path, "r", encoding="utf-8", newline="") as src, atomic_csv(path, fieldnames) as w:
+                for row in csv.DictReader(src):
+                    w.writerow(changed.pop(row[ID_COL], row))
+                    written += 1
+                for row in changed.values():
+                    w.writerow(row)
+                    written += 1
+    else:
+        with atomic_csv(path, fieldnames) as w:
+            for batch in iter_batches(query_db, **query):
+                w.writerows(map(page_row, batch))
+                fetched += len(batch)
+        written = fetched
+
+    if state is not None:
+        st.update({"title": title, "hwm": _watermark(started), "columns": prop_names, "query": query_sig})
+        if not incremental:
+            st["full_at"] = started
+    mode = "incremental" if incremental else "full"
+    log(f"Exported {title} -> {path} ({fetched} fetched, {written} written, {mode})")
+
+def _children(block_id: str) -> List[Dict[str, Any]]:
+    return [b for batch in iter_batches(list_children, block_id=block_id, page_size=100) for b in batch]
+
+def title_selected(title: str, include: List[str], exclude: List[str]) -> bool:
+    if include and not any(fnmatch.fnmatchcase(title, g) for g in include):
+        return False
+    return not any(fnmatch.fnmatchcase(title, g) for g in exclude)
+
+def discover_databases(root_id: str, include: List[str] = (), exclude: List[str] = (),
+                       workers: int = WORKERS) -> List[Dict[str, Any]]:
+    """Databases in the root page's subtree, walked breadth-first with each level listed in parallel.
+
+    Title globs are applied to the child_database blocks, so filtered-out databases are never retrieved.
+    """
+    found: Dict[str, str] = {}
+    level, seen = [root_id], {root_id}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        while level:
+            nxt: List[str] = []
+            for blocks in ex.map(_children, level):
+                for b in blocks:
+                    if b.get("type") == "child_database":
+                        title = b["child_database"].get("title", "")
+                        if title_selected(title, list(include), list(exclude)):
+                            found.setdefault(b["id"], title)
+                    elif b.get("type") in CONTAINER_TYPES and b.get("has_children") and b["id"] not in seen:
+                        seen.add(b["id"])
+                        nxt.append(b["id"])
+            level = nxt
+        log(f"Found {len(found)} database(s) under root")
+        return list(ex.map(lambda db_id: retrieve_db(database_id=db_id), found))
+
+def export_all(dbs: List[Dict[str, Any]], state: Optional[Dict[str, Any]] = None,
+               workers: int = WORKERS, fmt: str = "csv", specs: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    """Export databases concurrently; total time tends to the largest database rather than the sum.
+
+    Databases sharing a title get the id in their file name, so no two threads write one file.
+    """
+    lock = threading.Lock()
+    failed: List[str] = []
+    names = file_names(dbs)
 
-    for page in iterate_paginated_api(client.databases.query, database_id=db_id, page_size=100):
-        row: Dict[str,str] = {}
-        for name in prop_names:
-            row[name] = plain_val(page["properties"].get(name, {}))
-        rows.append(row)
+    def one(db: Dict[str, Any]) -> None:
+        try:
+            export_db(db, state, fmt, (specs or {}).get(db_title(db)), names[db["id"]])
+        except Exception as e:
+            log(f"FAILED {db_title(db) or db['id']}: {e}")
+            with lock:
+                failed.append(db["id"])
+            return
+        if state is not None:
+            with lock:
+                save_state(state)
 
-    path = os.path.join(OUT_DIR, f"{title}.csv")
-    with open(path, "w", encoding="utf-8", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=prop_names)
-        w.writeheader()
-        for r in rows:
-            w.writerow(r)
-    log(f"Exported {title} -> {path} ({len(rows)} rows)")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        list(ex.map(one, dbs))
+    if failed:
+        raise SystemExit(f"{len(failed)} database export(s) failed")
 
 def main():
-    # نصدّر كل قواعد DB تحت وركسبيسك (يمكنك لاحقًا تصفيتها بعنوان محدد)
-    for obj in iterate_paginated_api(client.search):
-        if obj.get("object") == "database":
-            export_db(obj)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--incremental", action="store_true",
+                    help="only fetch pages edited since the last run (state in EXPORT_DIR/.export_state.json)")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="databases exported in parallel")
+    ap.add_argument("--root", default=ROOT_PAGE_ID, help="page whose subtree is exported (default: ROOT_PAGE_ID)")
+    ap.add_argument("--include", action="append", default=[], metavar="GLOB", help="only databases whose title matches (repeatable)")
+    ap.add_argument("--exclude", action="append", default=[], metavar="GLOB", help="skip databases whose title matches (repeatable)")
+    ap.add_argument("--spec", default=os.environ.get("EXPORT_SPEC", ""),
+                    help="JSON file of per-database columns/filter/sorts keyed by title (see config/export-spec.example.json)")
+    ap.add_argument("--format", choices=["csv"] + sorted(SINKS), default="csv",
+                    help="csv (flattened text), parquet (typed columns) or jsonl (raw properties); the last two write a .<ext>.schema.json sidecar")
+    args = ap.parse_args()
+    if args.incremental and args.format != "csv":
+        raise SystemExit("--incremental is only supported for --format csv")
+    state = load_state() if args.incremental else None
+    if args.root:
+        dbs = discover_databases(args.root, args.include, args.exclude, args.workers)
+    else:
+        # بدون ROOT_PAGE_ID: نبحث في كامل الوركسبيس (أبطأ بكثير)
+        log("ROOT_PAGE_ID not set: falling back to a workspace-wide search")
+        dbs = [obj for obj in iterate_paginated_api(search, filter={"value": "database", "property": "object"})
+               if obj.get("object") == "database" and title_selected(db_title(obj), args.include, args.exclude)]
+    export_all(dbs, state, args.workers, args.format, load_spec(args.spec))
 
 if __name__ == "__main__":
     main()
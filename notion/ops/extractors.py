@@ -0,0 +1,131 @@
+"""Property -> text extractors for CSV export, compiled once per database schema.
+
+`compile_row(props)` looks at the database schema once and returns a function that turns a
+page into a row dict using one specialized extractor per column, instead of branching on the
+property type for every cell. Every Notion property type has an extractor; unknown types
+fall back to compact JSON rather than silently becoming "".
+"""
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Extractor = Callable[[Any], str]
+
+def _text(v: Any) -> str:
+    if not v:
+        return ""
+    if len(v) == 1:
+        return v[0].get("plain_text", "")
+    return "".join([x.get("plain_text", "") for x in v])
+
+def _number(v: Any) -> str:
+    return "" if v is None else str(v)
+
+def _name(v: Any) -> str:
+    return v.get("name", "") if v else ""
+
+def _names(v: Any) -> str:
+    return ",".join([x.get("name", "") for x in v]) if v else ""
+
+def _date(v: Any) -> str:
+    if not v:
+        return ""
+    start = v.get("start") or ""
+    end = v.get("end")
+    return f"{start}..{end}" if end else start
+
+def _people(v: Any) -> str:
+    return ",".join([x.get("name") or x.get("id", "") for x in v]) if v else ""
+
+def _user(v: Any) -> str:
+    return (v.get("name") or v.get("id", "")) if v else ""
+
+def _ids(v: Any) -> str:
+    return ",".join([x.get("id", "") for x in v]) if v else ""
+
+def _files(v: Any) -> str:
+    if not v:
+        return ""
+    return ",".join([(x.get(x.get("type")) or {}).get("url") or x.get("name", "") for x in v])
+
+def _checkbox(v: Any) -> str:
+    return "true" if v else "false"
+
+def _str(v: Any) -> str:
+    return "" if v is None else str(v)
+
+def _unique_id(v: Any) -> str:
+    if not v or v.get("number") is None:
+        return ""
+    return f"{v['prefix']}-{v['number']}" if v.get("prefix") else str(v["number"])
+
+def _verification(v: Any) -> str:
+    return v.get("state", "") if v else ""
+
+def _json(v: Any) -> str:
+    return "" if v is None else json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+
+def _typed(v: Any) -> str:
+    """formula / rollup values: {"type": <t>, <t>: value} (rollup arrays hold whole property values)."""
+    if not v:
+        return ""
+    t = v.get("type")
+    x = v.get(t)
+    if t == "array":
+        return ",".join([s for s in (plain_val(p) for p in (x or [])) if s])
+    if t == "boolean":
+        return _checkbox(x)
+    if t == "date":
+        return _date(x)
+    return _str(x)
+
+EXTRACTORS: Dict[str, Extractor] = {
+    "title": _text,
+    "rich_text": _text,
+    "number": _number,
+    "select": _name,
+    "status": _name,
+    "multi_select": _names,
+    "date": _date,
+    "people": _people,
+    "relation": _ids,
+    "files": _files,
+    "checkbox": _checkbox,
+    "url": _str,
+    "email": _str,
+    "phone_number": _str,
+    "formula": _typed,
+    "rollup": _typed,
+    "created_time": _str,
+    "last_edited_time": _str,
+    "created_by": _user,
+    "last_edited_by": _user,
+    "unique_id": _unique_id,
+    "verification": _verification,
+    "button": lambda v: "",
+}
+
+def plain_val(p: Dict[str, Any]) -> str:
+    """Generic (per-cell dispatch) flattening of one property value."""
+    if not p:
+        return ""
+    t = p.get("type")
+    return EXTRACTORS.get(t, _json)(p.get(t))
+
+def compile_extractors(props: Dict[str, Any]) -> List[Tuple[str, str, Extractor]]:
+    """[(column, notion type, extractor)] for a database schema, resolved once."""
+    return [(name, meta.get("type", ""), EXTRACTORS.get(meta.get("type", ""), _json)) for name, meta in props.items()]
+
+def compile_row(props: Dict[str, Any], id_col: Optional[str] = None) -> Callable[[Dict[str, Any]], Dict[str, str]]:
+    """page -> {column: text} using the precompiled per-column extractors."""
+    table = compile_extractors(props)
+
+    def row(page: Dict[str, Any]) -> Dict[str, str]:
+        values = page["properties"]
+        out: Dict[str, str] = {id_col: page["id"]} if id_col else {}
+        for name, t, fn in table:
+            p = values.get(name)
+            # a page value whose type drifted from the schema (retyped column) goes through generic dispatch
+            out[name] = "" if p is None else (fn(p.get(t)) if p.get("type") == t else plain_val(p))
+        return out
+
+    return row
@@ -0,0 +1,297 @@
+"""Export page bodies (block trees) to Markdown, laid out like docs/ifns, and check them for drift.
+
+    python notion/ops/page_export.py [--root PAGE_ID] [--out content/pages/exports]
+    python notion/ops/page_export.py --check        # compare Notion with docs/ without writing
+
+The tree under the root is fetched level by level: every block with `has_children` on one level
+is listed in parallel (all calls share ratelimit.LIMITER), so wall time follows the depth of the
+tree rather than its size. child_database blocks are not descended into (export.py covers rows).
+
+Pages are mapped back to the files the IFNS scripts publish from:
+    pages in config/ifns-mappings.json       -> their "source"
+    "Step NN ..." under IFNS – UI Master      -> docs/ifns/Step_NN_*.md   (01/02/03 child pages = sections)
+    "Stage NN ..." under Core ML Build Stages -> docs/ifns/stages/Stage_NN_*.md (same)
+    pages under Tables & Telemetry (DB Hub)   -> docs/ifns/tables/<Title_With_Underscores>.md
+Everything else is written under <out>/_unmapped/<page path>.md so the whole tree is backed up.
+"""
+import os, re, glob, json, time, difflib, argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from notion_client import Client
+from notion_client.helpers import iterate_paginated_api
+from ratelimit import limited
+
+NOTION_TOKEN = os.environ.get("NOTION_TOKEN", "")
+ROOT_PAGE_ID = os.environ.get("ROOT_PAGE_ID") or os.environ.get("NOTION_ROOT_PAGE_ID", "")
+if not NOTION_TOKEN:
+    raise SystemExit("Missing NOTION_TOKEN")
+
+OUT_DIR = "content/pages/exports"
+DOCS_DIR = "docs"
+MAPPINGS_FILE = "config/ifns-mappings.json"
+WORKERS = int(os.environ.get("EXPORT_WORKERS", "4"))
+
+MASTER_TITLE = "IFNS – UI Master"
+STAGES_HUB_TITLE = "Core ML Build Stages"
+TABLES_HUB_TITLE = "Tables & Telemetry (DB Hub)"
+SECTION_RE = re.compile(r"^(0[1-3])\b")
+
+client = Client(auth=NOTION_TOKEN)
+list_children = limited(client.blocks.children.list)
+
+def log(m: str) -> None:
+    print(f"[pages] {time.strftime('%H:%M:%S')} {m}", flush=True)
+
+# ---------- fetching ----------
+def _children(block_id: str) -> List[Dict[str, Any]]:
+    return list(iterate_paginated_api(list_children, block_id=block_id, page_size=100))
+
+def fetch_tree(root_id: str, workers: int = WORKERS) -> List[Dict[str, Any]]:
+    """Children of root_id with every nested block's children attached under "children"."""
+    top = _children(root_id)
+    level = top
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        while level:
+            parents = [b for b in level if b.get("has_children") and b.get("type") != "child_database"]
+            nxt: List[Dict[str, Any]] = []
+            for b, kids in zip(parents, ex.map(lambda b: _children(b["id"]), parents)):
+                b["children"] = kids
+                nxt.extend(kids)
+            level = nxt
+    return top
+
+# ---------- blocks -> Markdown ----------
+def rich_md(rt: List[Dict[str, Any]]) -> str:
+    out = []
+    for r in rt or []:
+        s = r.get("plain_text", "")
+        a = r.get("annotations") or {}
+        if r.get("type") == "equation":
+            s = f"${s}$"
+        elif s.strip():
+            if a.get("code"): s = f"`{s}`"
+            if a.get("bold"): s = f"**{s}**"
+            if a.get("italic"): s = f"*{s}*"
+            if a.get("strikethrough"): s = f"~~{s}~~"
+            if r.get("href"): s = f"[{s}]({r['href']})"
+        out.append(s)
+    return "".join(out)
+
+def _indent(text: str, prefix: str = "    ") -> str:
+    return "\n".join(prefix + line if line else line for line in text.split("\n"))
+
+def _file_url(v: Dict[str, Any]) -> str:
+    return (v.get(v.get("type")) or {}).get("url", "") or v.get("url", "")
+
+LIST_TYPES = {"bulleted_list_item", "numbered_list_item", "to_do"}
+
+def block_md(b: Dict[str, Any], n: int = 1) -> str:
+    t = b.get("type", "")
+    v = b.get(t) or {}
+    text = rich_md(v.get("rich_text", []))
+    kids = blocks_md(b.get("children", [])) if t not in ("child_page", "table") else ""
+    if t == "paragraph":
+        body = text
+    elif t in ("heading_1", "heading_2", "heading_3"):
+        body = "#" * int(t[-1]) + " " + text
+    elif t == "bulleted_list_item":
+        body = f"- {text}"
+    elif t == "numbered_list_item":
+        body = f"{n}. {text}"
+    elif t == "to_do":
+        body = f"- [{'x' if v.get('checked') else ' '}] {text}"
+    elif t in ("quote", "callout"):
+        icon = (v.get("icon") or {}).get("emoji", "") if t == "callout" else ""
+        body = _indent(f"{icon} {text}".strip() + (f"\n\n{kids}" if kids else ""), "> ")
+        kids = ""
+    elif t == "toggle":
+        body = f"<details><summary>{text}</summary>\n\n{kids}\n\n</details>"
+        kids = ""
+    elif t == "code":
+        body = f"```{v.get('language', '')}\n{text}\n```"
+    elif t == "equation":
+        body = f"$$\n{v.get('expression', '')}\n$$"
+    elif t == "divider":
+        body = "---"
+    elif t in ("image", "file", "pdf", "video", "audio"):
+        cap = rich_md(v.get("caption", [])) or t
+        body = f"{'!' if t == 'image' else ''}[{cap}]({_file_url(v)})"
+    elif t in ("bookmark", "embed", "link_preview"):
+        body = f"[{rich_md(v.get('caption', [])) or v.get('url', '')}]({v.get('url', '')})"
+    elif t == "table":
+        rows = [[rich_md(c) for c in r.get("table_row", {}).get("cells", [])] for r in b.get("children", [])]
+        if not rows:
+            return ""
+        lines = ["| " + " | ".join(c.replace("|", "\\|") for c in r) + " |" for r in rows]
+        lines.insert(1, "|" + " --- |" * len(rows[0]))
+        body = "\n".join(lines)
+    elif t == "child_page":
+        return f"- [{v.get('title', '')}]({slug(v.get('title', ''))}.md)"
+    elif t == "child_database":
+        return f"*Database: {v.get('title', '')}* (see content/databases/exports)"
+    elif t in ("column_list", "column", "synced_block", "template"):
+        return kids
+    elif t == "table_of_contents":
+        return "[TOC]"
+    else:
+        return f"<!-- unsupported block: {t} -->"
+    if kids:
+        body += "\n" + (_indent(kids) if t in LIST_TYPES else kids)
+    return body
+
+def blocks_md(blocks: List[Dict[str, Any]]) -> str:
+    """Render sibling blocks. Paragraph chunks that end in a newline are raw Markdown written by
+    the IFNS sync scripts (chunk_text keeps line breaks) and are concatenated back verbatim."""
+    out = ""
+    n = 0
+    prev = ""
+    for b in blocks:
+        t = b.get("type", "")
+        n = n + 1 if t == "numbered_list_item" else 0
+        s = block_md(b, n)
+        if not s:
+            continue
+        if not out or out.endswith("\n"):
+            out += s
+        else:
+            out += ("\n" if t in LIST_TYPES and prev in LIST_TYPES else "\n\n") + s
+        prev = t
+    return out
+
+def slug(title: str) -> str:
+    s = re.sub(r"[^\w\-]+", "_", title.strip(), flags=re.UNICODE).strip("_")
+    return s or "untitled"
+
+# ---------- layout ----------
+def _pages(blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [b for b in blocks if b.get("type") == "child_page"]
+
+def _title(b: Dict[str, Any]) -> str:
+    return (b.get("child_page") or {}).get("title", "").strip()
+
+def _one(pattern: str) -> Optional[str]:
+    hits = sorted(glob.glob(pattern))
+    return hits[0] if hits else None
+
+def sectioned(page: Dict[str, Any]) -> Dict[str, str]:
+    """{"01": text, ...} from a Step/Stage page's 01/02/03 child pages."""
+    out = {}
+    for c in _pages(page.get("children", [])):
+        m = SECTION_RE.match(_title(c))
+        if m:
+            out[m.group(1)] = blocks_md(c.get("children", [])).strip()
+    return out
+
+def layout(tree: List[Dict[str, Any]], mappings: Dict[str, str]) -> List[Tuple[str, str, Any, Dict[str, Any]]]:
+    """[(docs-relative path or _unmapped path, kind "body"|"sections", content, page block)] for every page."""
+    docs: List[Tuple[str, str, Any, Dict[str, Any]]] = []
+
+    def walk(blocks: List[Dict[str, Any]], parent: str, trail: List[str]) -> None:
+        for p in _pages(blocks):
+            title = _title(p)
+            kids = p.get("children", [])
+            m = re.match(r"(Step|Stage)\s+(\d+)", title)
+            path = mappings.get(title)
+            if m and parent in (MASTER_TITLE, STAGES_HUB_TITLE):
+                n = int(m.group(2))
+                pattern = (f"{DOCS_DIR}/ifns/Step_{n:02d}_*.md" if m.group(1) == "Step"
+                           else f"{DOCS_DIR}/ifns/stages/Stage_{n:02d}_*.md")
+                path = _one(pattern) or pattern.replace("*", slug(title))
+                docs.append((path, "sections", sectioned(p), p))
+                # 01/02/03 children are part of this file; anything else below is walked normally
+                walk([c for c in _pages(kids) if not SECTION_RE.match(_title(c))], title, trail + [title])
+                continue
+            if not path and parent == TABLES_HUB_TITLE:
+                path = f"{DOCS_DIR}/ifns/tables/{title.replace(' ', '_')}.md"
+            if not path:
+                path = os.path.join("_unmapped", *[slug(x) for x in trail + [title]]) + ".md"
+            docs.append((path, "body", blocks_md(kids).strip(), p))
+            walk(kids, title, trail + [title])
+
+    walk(tree, "", [])
+    return docs
+
+def render(kind: str, title: str, content: Any) -> str:
+    if kind == "sections":
+        return f"# {title}\n\n" + "\n\n".join(content[k] for k in sorted(content)) + "\n"
+    return content + "\n"
+
+def _out_path(out_dir: str, path: str) -> str:
+    rel = os.path.relpath(path, DOCS_DIR) if path.startswith(DOCS_DIR + "/") else path
+    return os.path.join(out_dir, rel)
+
+def split_sections(md_text: str) -> Dict[str, str]:
+    """Same split as the IFNS sync scripts (## 01 / ## 02 / ## 03)."""
+    pattern = re.compile(r"^##\s*(0[1-3])\b.*$", re.MULTILINE)
+    matches = list(pattern.finditer(md_text))
+    return {m.group(1): md_text[m.start():(matches[i + 1].start() if i + 1 < len(matches) else len(md_text))].strip()
+            for i, m in enumerate(matches)}
+
+def drift(path: str, kind: str, content: Any) -> List[str]:
+    """Unified-diff lines between the local file and what Notion holds (empty = in sync)."""
+    if not os.path.exists(path):
+        return [f"missing locally: {path}"]
+    with open(path, "r", encoding="utf-8-sig") as f:
+        local = f.read()
+    if kind == "sections":
+        pairs = [(k, split_sections(local).get(k, ""), content.get(k, "")) for k in ("01", "02", "03")]
+    else:
+        pairs = [("", local.strip(), content)]
+    out: List[str] = []
+    for k, a, b in pairs:
+        if a != b:
+            out.extend(difflib.unified_diff(a.splitlines(), b.splitlines(), f"git:{path}{' #' + k if k else ''}",
+                                            f"notion{' #' + k if k else ''}", lineterm="", n=1))
+    return out
+
+def load_mappings(path: str = MAPPINGS_FILE) -> Dict[str, str]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    return {p["title"]: p["source"] for p in cfg.get("ifns", {}).get("pages", []) if p.get("source")}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=ROOT_PAGE_ID, help="page whose subtree is exported (default: ROOT_PAGE_ID)")
+    ap.add_argument("--out", default=OUT_DIR)
+    ap.add_argument("--workers", type=int, default=WORKERS, help="parallel block listings per tree level")
+    ap.add_argument("--check", action="store_true", help="report drift against docs/ instead of writing files; exit 1 on drift")
+    ap.add_argument("--diff", action="store_true", help="with --check: print the diffs")
+    args = ap.parse_args()
+    if not args.root:
+        raise SystemExit("Missing --root / ROOT_PAGE_ID")
+
+    t0 = time.time()
+    tree = fetch_tree(args.root, args.workers)
+    docs = layout(tree, load_mappings())
+    log(f"Fetched {len(docs)} page(s) in {time.time() - t0:.1f}s")
+
+    if args.check:
+        drifted = 0
+        for path, kind, content, _ in docs:
+            if path.startswith("_unmapped"):
+                continue
+            d = drift(path, kind, content)
+            if d:
+                drifted += 1
+                log(f"DRIFT {path}")
+                if args.diff:
+                    print("\n".join(d))
+            else:
+                log(f"ok    {path}")
+        if drifted:
+            raise SystemExit(f"{drifted} page(s) differ between Notion and git")
+        return
+
+    for path, kind, content, page in docs:
+        dest = _out_path(args.out, path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(render(kind, _title(page), content))
+        os.replace(tmp, dest)
+    log(f"Wrote {len(docs)} file(s) under {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Run an iterator one item ahead on a background thread (export pages, command windows)."""
+import queue, threading
+from typing import Any, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+def prefetch(items: Iterable[T]) -> Iterator[T]:
+    """Yield `items`, producing the next one on a background thread while the caller works.
+
+    The queue holds a single item, so the producer stops while the consumer is behind
+    (backpressure) and at most ~2 items are held. Errors in the producer are re-raised here.
+    """
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=1)
+
+    def run() -> None:
+        try:
+            for item in items:
+                q.put(item)
+            q.put(_DONE)
+        except BaseException as e:  # re-raised in the consumer
+            q.put(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
@@ -0,0 +1,55 @@
+"""Process-wide pacing for Notion API calls made from several threads (export, command runner,
+scripts/ifns_sync.py, which only uses RateLimiter/LIMITER and has no notion-client installed)."""
+import os, time, threading
+from functools import wraps
+from typing import Any, Callable
+
+try:
+    from notion_client.errors import HTTPResponseError
+except Exception:
+    HTTPResponseError = None
+
+class RateLimiter:
+    """Spaces calls `1/rate` seconds apart across all threads; `backoff` pushes everyone back after a 429."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+    def backoff(self, seconds: float) -> None:
+        with self.lock:
+            self.next_at = max(self.next_at, time.monotonic() + seconds)
+
+# Notion allows ~3 requests/s per integration on average.
+LIMITER = RateLimiter(float(os.environ.get("NOTION_RATE_LIMIT", "3")))
+
+def _retry_after(e: Exception, attempt: int) -> float:
+    headers = getattr(e, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return float(2 ** attempt)
+
+def limited(fn: Callable[..., Any], retries: int = 5) -> Callable[..., Any]:
+    """Wrap a notion_client endpoint so every call goes through LIMITER and 429/5xx are retried."""
+    @wraps(fn)
+    def call(*args: Any, **kwargs: Any) -> Any:
+        for attempt in range(retries):
+            LIMITER.wait()
+            try:
+                return fn(*args, **kwargs)
+            except HTTPResponseError as e:
+                status = getattr(e, "status", 0)
+                if attempt == retries - 1 or not (status == 429 or status >= 500):
+                    raise
+                LIMITER.backoff(_retry_after(e, attempt))
+    return call
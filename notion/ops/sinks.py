@@ -0,0 +1,181 @@
+"""Typed export sinks for export.py (--format jsonl|parquet).
+
+Every sink writes `<title>.<ext>` atomically (temp file + rename) batch by batch, plus a
+`<title>.<ext>.schema.json` sidecar describing each column's Notion type (and Arrow type for
+Parquet); the sidecar is named per format so exporting both formats keeps both.
+"""
+import os, json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except Exception:
+    pa = None
+    pq = None
+
+def write_sidecar(path: str, title: str, db_id: str, columns: Dict[str, Dict[str, Any]]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"database": title, "database_id": db_id, "columns": columns}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+class Sink:
+    """Base: subclasses implement _open/_write/_close on self.tmp."""
+    ext = ""
+
+    def __init__(self, out_dir: str, title: str, db_id: str, props: Dict[str, Any]) -> None:
+        self.path = os.path.join(out_dir, f"{title}.{self.ext}")
+        self.schema_path = f"{self.path}.schema.json"
+        self.tmp = f"{self.path}.tmp"
+        self.title, self.db_id = title, db_id
+        self.types = {name: meta.get("type", "rich_text") for name, meta in props.items()}
+        self.rows = 0
+
+    def __enter__(self) -> "Sink":
+        self._open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            self._close()
+            if exc_type is None:
+                os.replace(self.tmp, self.path)
+                write_sidecar(self.schema_path, self.title, self.db_id, self.schema())
+        finally:
+            if os.path.exists(self.tmp):
+                os.remove(self.tmp)
+
+    def write(self, pages: List[Dict[str, Any]]) -> None:
+        self._write(pages)
+        self.rows += len(pages)
+
+    def schema(self) -> Dict[str, Dict[str, Any]]:
+        return {name: {"notion_type": t} for name, t in self.types.items()}
+
+    def _open(self) -> None: ...
+    def _write(self, pages: List[Dict[str, Any]]) -> None: ...
+    def _close(self) -> None: ...
+
+class JsonlSink(Sink):
+    """One JSON object per page, keeping Notion's raw property structure."""
+    ext = "jsonl"
+
+    def _open(self) -> None:
+        self.f = open(self.tmp, "w", encoding="utf-8")
+
+    def _write(self, pages: List[Dict[str, Any]]) -> None:
+        self.f.writelines(
+            json.dumps({
+                "id": p["id"],
+                "created_time": p.get("created_time"),
+                "last_edited_time": p.get("last_edited_time"),
+                "properties": p.get("properties", {}),
+            }, ensure_ascii=False) + "\n"
+            for p in pages
+        )
+
+    def _close(self) -> None:
+        self.f.close()
+
+# ---------- Parquet ----------
+def _ts(s: Optional[str]) -> Optional[datetime]:
+    if not s:
+        return None
+    return datetime.fromisoformat(s.replace("Z", "+00:00"))
+
+def _text(v: Any) -> str:
+    return "".join(x.get("plain_text", "") for x in (v or []))
+
+def _names(v: Any) -> List[str]:
+    return [x.get("name", "") for x in (v or [])]
+
+def _formula(v: Any) -> Optional[str]:
+    if not v:
+        return None
+    x = v.get(v.get("type"))
+    return None if x is None else (json.dumps(x) if isinstance(x, dict) else str(x))
+
+if pa is not None:
+    _TS = pa.timestamp("ms", tz="UTC")
+    _DATE = pa.struct([("start", _TS), ("end", _TS)])
+    # Notion type -> (Arrow type, value extractor taking the property's inner value)
+    ARROW_COLUMNS = {
+        "title": (pa.string(), _text),
+        "rich_text": (pa.string(), _text),
+        "number": (pa.float64(), lambda v: None if v is None else float(v)),
+        "checkbox": (pa.bool_(), lambda v: bool(v)),
+        "select": (pa.string(), lambda v: (v or {}).get("name")),
+        "status": (pa.string(), lambda v: (v or {}).get("name")),
+        "multi_select": (pa.list_(pa.string()), _names),
+        "people": (pa.list_(pa.string()), lambda v: [x.get("name") or x.get("id", "") for x in (v or [])]),
+        "relation": (pa.list_(pa.string()), lambda v: [x.get("id", "") for x in (v or [])]),
+        "date": (_DATE, lambda v: {"start": _ts(v.get("start")), "end": _ts(v.get("end"))} if v else None),
+        "created_time": (_TS, _ts),
+        "last_edited_time": (_TS, _ts),
+        "url": (pa.string(), lambda v: v),
+        "email": (pa.string(), lambda v: v),
+        "phone_number": (pa.string(), lambda v: v),
+        "formula": (pa.string(), _formula),
+    }
+
+class ParquetSink(Sink):
+    """Typed columns (numbers, booleans, lists, timestamps); page batches are buffered into row groups."""
+    ext = "parquet"
+    row_group = int(os.environ.get("EXPORT_PARQUET_ROW_GROUP", "10000"))
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        if pa is None:
+            raise SystemExit("pyarrow not installed (pip install pyarrow)")
+        super().__init__(*args, **kwargs)
+        fallback = (pa.string(), lambda v: None if v is None else json.dumps(v, ensure_ascii=False))
+        self.columns = [(name, t) + ARROW_COLUMNS.get(t, fallback) for name, t in self.types.items()]
+        self.arrow_schema = pa.schema(
+            [("_page_id", pa.string()), ("_last_edited_time", _TS)]
+            + [(name, atype) for name, _, atype, _ in self.columns]
+        )
+
+    def _open(self) -> None:
+        self.writer = pq.ParquetWriter(self.tmp, self.arrow_schema, compression="zstd")
+        self.pending: List[Any] = []
+        self.pending_rows = 0
+
+    def _write(self, pages: List[Dict[str, Any]]) -> None:
+        if not pages:
+            return
+        self.pending.append(self._batch(pages))
+        self.pending_rows += len(pages)
+        if self.pending_rows >= self.row_group:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self.pending:
+            self.writer.write_table(pa.Table.from_batches(self.pending, schema=self.arrow_schema),
+                                    row_group_size=self.pending_rows)
+        self.pending, self.pending_rows = [], 0
+
+    def _batch(self, pages: List[Dict[str, Any]]) -> Any:
+        arrays = [
+            pa.array([p["id"] for p in pages], pa.string()),
+            pa.array([_ts(p.get("last_edited_time")) for p in pages], _TS),
+        ]
+        for name, t, atype, get in self.columns:
+            vals = []
+            for p in pages:
+                prop = p.get("properties", {}).get(name)
+                vals.append(get(prop.get(t)) if prop else None)
+            arrays.append(pa.array(vals, atype))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.arrow_schema)
+
+    def _close(self) -> None:
+        self._flush()
+        self.writer.close()
+
+    def schema(self) -> Dict[str, Dict[str, Any]]:
+        out = super().schema()
+        for name, _, atype, _ in self.columns:
+            out[name]["arrow_type"] = str(atype)
+        return out
+
+SINKS = {"jsonl": JsonlSink, "parquet": ParquetSink}
@@ -0,0 +1,220 @@
+"""Row-level diff between two export snapshots (or two directories of exported CSVs).
+
+    python notion/ops/snapshots.py diff 2024-03-01 latest [--key auto|page|unique|COLUMN] [--json]
+
+Rows are matched by page id, by the database's unique_key from schemas/databases.yml, or by an
+explicit column. Snapshots keyed by page id are already sorted by it, so they are compared with a
+streaming merge: chunks whose ids are identical on both sides are skipped without being decoded,
+and memory stays at about two chunks. Any other key uses a hashed index of the old side
+(key -> 8-byte row digest) and a second pass to pull the old values of changed rows only.
+
+Text output is a per-database summary with the first --limit rows; --json writes one JSON object
+per line: {"database", "op": "added"|"removed"|"changed", "key", "changes": {col: [old, new]}},
+followed by a {"op": "summary"} line per database.
+"""
+import os, io, csv, sys, json, hashlib
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import snapshots
+
+try:
+    import yaml  # type: ignore
+except Exception:
+    yaml = None
+
+SCHEMAS_FILE = os.path.join("schemas", "databases.yml")
+
+class Table:
+    """One database on one side of the diff: header plus a way to read its rows."""
+
+    def __init__(self, title: str, header: List[str], chunks: Optional[List[str]] = None,
+                 path: Optional[str] = None, sorted_by: Optional[str] = None, rows: int = -1) -> None:
+        self.title, self.header, self.chunks, self.path = title, header, chunks, path
+        self.sorted_by, self.count = sorted_by, rows
+        self._dctx = snapshots.zstd.ZstdDecompressor() if chunks is not None else None
+
+    def read_chunk(self, cid: str) -> List[List[str]]:
+        data = snapshots.read_chunk(cid, self._dctx).decode("utf-8")
+        return [row for row in csv.reader(io.StringIO(data)) if row]
+
+    def rows(self) -> Iterator[List[str]]:
+        if self.chunks is not None:
+            for cid in self.chunks:
+                yield from self.read_chunk(cid)
+            return
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            r = csv.reader(f)
+            next(r, None)
+            yield from (row for row in r if row)
+
+def open_side(spec: str) -> Dict[str, Table]:
+    """A snapshot date ("latest" works too) or a directory of CSVs -> {title: Table}."""
+    if os.path.isdir(spec):
+        out = {}
+        for name in sorted(n for n in os.listdir(spec) if n.endswith(".csv")):
+            path = os.path.join(spec, name)
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                header = next(csv.reader(f), [])
+            out[os.path.splitext(name)[0]] = Table(os.path.splitext(name)[0], header, path=path)
+        return out
+    snapshots._require_zstd()
+    date = snapshots.resolve_date(spec)
+    return {m["database"]: Table(m["database"], m["header"], chunks=m["chunks"], sorted_by=m.get("key"), rows=m["rows"])
+            for m in snapshots.load_manifests(date)}
+
+def _norm(title: str) -> str:
+    return title.strip().lower().replace(" ", "_")
+
+def unique_keys(path: str = SCHEMAS_FILE) -> Dict[str, str]:
+    """{normalized database name: unique_key} from schemas/databases.yml."""
+    if yaml is None or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    return {_norm(d["name"]): d["unique_key"] for d in data.get("databases", []) if d.get("name") and d.get("unique_key")}
+
+def pick_key(old: Table, new: Table, key: str, uniques: Dict[str, str]) -> str:
+    both = [c for c in new.header if c in old.header]
+    if key == "page" or (key == "auto" and snapshots.ID_COL in both):
+        candidate = snapshots.ID_COL
+    elif key in ("unique", "auto"):
+        candidate = uniques.get(_norm(new.title)) or (both[0] if both else "")
+    else:
+        candidate = key
+    if candidate not in both:
+        raise SystemExit(f"{new.title}: key column {candidate!r} is not present on both sides")
+    return candidate
+
+def _getter(header: List[str], cols: List[str]) -> Callable[[List[str]], List[str]]:
+    idx = [header.index(c) for c in cols]
+    width = len(header)
+    return lambda row: [row[i] for i in idx] if len(row) >= width else [row[i] if i < len(row) else "" for i in idx]
+
+def _changes(cols: List[str], a: List[str], b: List[str]) -> Dict[str, List[str]]:
+    return {c: [x, y] for c, x, y in zip(cols, a, b) if x != y}
+
+def _digest(values: List[str]) -> bytes:
+    return hashlib.blake2b("\x1f".join(values).encode("utf-8"), digest_size=8).digest()
+
+class _Cursor:
+    """Row cursor over a snapshot's chunk list that can skip whole chunks without decoding them."""
+
+    def __init__(self, table: Table) -> None:
+        self.table = table
+        self.chunks = iter(table.chunks)
+        self.cid = next(self.chunks, None)
+        self.rows: Optional[List[List[str]]] = None
+        self.i = 0
+
+    def skip_chunk(self) -> None:
+        self.cid = next(self.chunks, None)
+        self.rows, self.i = None, 0
+
+    def peek(self) -> Optional[List[str]]:
+        while self.cid is not None:
+            if self.rows is None:
+                self.rows, self.i = self.table.read_chunk(self.cid), 0
+            if self.i < len(self.rows):
+                return self.rows[self.i]
+            self.skip_chunk()
+        return None
+
+    def advance(self) -> None:
+        self.i += 1
+        if self.i >= len(self.rows):
+            self.skip_chunk()
+
+def merge_diff(old: Table, new: Table, key: str, cols: List[str]) -> Iterator[Dict[str, Any]]:
+    """Streaming diff of two tables sorted by `key` (snapshots keyed by page id)."""
+    ko, kn = old.header.index(key), new.header.index(key)
+    po, pn = _getter(old.header, cols), _getter(new.header, cols)
+    o, n = _Cursor(old), _Cursor(new)
+    while True:
+        if o.rows is None and n.rows is None and o.cid is not None and o.cid == n.cid:
+            o.skip_chunk()
+            n.skip_chunk()
+            continue
+        a, b = o.peek(), n.peek()
+        if a is None and b is None:
+            return
+        if b is None or (a is not None and a[ko] < b[kn]):
+            yield {"op": "removed", "key": a[ko]}
+            o.advance()
+        elif a is None or b[kn] < a[ko]:
+            yield {"op": "added", "key": b[kn]}
+            n.advance()
+        else:
+            if a != b:
+                changes = _changes(cols, po(a), pn(b))
+                if changes:
+                    yield {"op": "changed", "key": b[kn], "changes": changes}
+            o.advance()
+            n.advance()
+
+def hash_diff(old: Table, new: Table, key: str, cols: List[str]) -> Iterator[Dict[str, Any]]:
+    """Diff by an arbitrary key: index the old side as key -> digest, stream the new side against it."""
+    ko, kn = old.header.index(key), new.header.index(key)
+    po, pn = _getter(old.header, cols), _getter(new.header, cols)
+    index: Dict[str, bytes] = {}
+    for row in old.rows():
+        index[row[ko]] = _digest(po(row))
+    changed: Dict[str, List[str]] = {}
+    for row in new.rows():
+        k = row[kn]
+        d = index.pop(k, None)
+        if d is None:
+            yield {"op": "added", "key": k}
+        elif d != _digest(pn(row)):
+            changed[k] = pn(row)
+    for k in index:
+        yield {"op": "removed", "key": k}
+    if changed:
+        for row in old.rows():
+            b = changed.pop(row[ko], None)
+            if b is not None:
+                yield {"op": "changed", "key": row[ko], "changes": _changes(cols, po(row), b)}
+
+def diff_table(old: Table, new: Table, key: str) -> Iterator[Dict[str, Any]]:
+    cols = [c for c in new.header if c in old.header and c != key]
+    if old.chunks is not None and new.chunks is not None and old.sorted_by == key == new.sorted_by:
+        return merge_diff(old, new, key, cols)
+    return hash_diff(old, new, key, cols)
+
+def run(old_spec: str, new_spec: str, key: str = "auto", only: Optional[List[str]] = None,
+        as_json: bool = False, limit: int = 20, out=sys.stdout) -> int:
+    """Print the diff; returns the total number of added/removed/changed rows."""
+    old, new = open_side(old_spec), open_side(new_spec)
+    uniques = unique_keys()
+    total = 0
+    for title in sorted(set(old) | set(new)):
+        if only and title not in only:
+            continue
+        if title not in old or title not in new:
+            op = "database_added" if title in new else "database_removed"
+            out.write(json.dumps({"database": title, "op": op}) + "\n" if as_json else f"{title}: {op.replace('_', ' ')}\n")
+            continue
+        a, b = old[title], new[title]
+        k = pick_key(a, b, key, uniques)
+        counts = {"added": 0, "removed": 0, "changed": 0}
+        shown: List[str] = []
+        for rec in diff_table(a, b, k):
+            counts[rec["op"]] += 1
+            if as_json:
+                out.write(json.dumps({"database": title, **rec}, ensure_ascii=False) + "\n")
+            elif len(shown) < limit:
+                mark = {"added": "+", "removed": "-", "changed": "~"}[rec["op"]]
+                detail = "; ".join(f"{c}: {x!r} -> {y!r}" for c, (x, y) in rec.get("changes", {}).items())
+                shown.append(f"  {mark} {rec['key']}" + (f"  {detail}" if detail else ""))
+        columns = {"columns_added": [c for c in b.header if c not in a.header],
+                   "columns_removed": [c for c in a.header if c not in b.header]}
+        total += sum(counts.values())
+        if as_json:
+            out.write(json.dumps({"database": title, "op": "summary", "key": k, **counts, **columns}, ensure_ascii=False) + "\n")
+        elif sum(counts.values()) or columns["columns_added"] or columns["columns_removed"]:
+            cols = "".join(f"  {name.replace('_', ' ')}: {v}" for name, v in columns.items() if v)
+            out.write(f"{title} (by {k}): +{counts['added']} -{counts['removed']} ~{counts['changed']}{cols}\n")
+            out.writelines(line + "\n" for line in shown)
+            more = sum(counts.values()) - len(shown)
+            if more > 0:
+                out.write(f"  ... {more} more\n")
+    return total
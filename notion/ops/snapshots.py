@@ -0,0 +1,219 @@
+"""Content-addressed, deduplicated snapshots of the CSV exports (content/databases/exports).
+
+    python notion/ops/snapshots.py snapshot [--date YYYY-MM-DD]
+    python notion/ops/snapshots.py restore  [--date YYYY-MM-DD|latest] [--out DIR]
+    python notion/ops/snapshots.py list
+    python notion/ops/snapshots.py gc
+    python notion/ops/snapshots.py diff OLD [NEW]   (see snapshot_diff.py)
+
+Each database CSV is sorted by page id and cut into row chunks. A chunk ends after a row whose
+page-id hash hits the boundary condition (content-defined chunking), so adding, editing or removing
+a row only changes the chunk it lives in; every other chunk keeps its bytes and its id.
+Chunks are stored once, zstd-compressed, under their sha256:
+
+    snapshots/chunks/ab/ab12....csv.zst
+    snapshots/manifests/<date>/<title>.json   {"header": [...], "rows": n, "chunks": [sha256, ...]}
+
+A day's snapshot therefore only adds the chunks that changed plus small manifests.
+Restored CSVs hold the same rows as the export, ordered by page id.
+"""
+import os, io, csv, sys, json, hashlib, argparse
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard as zstd  # type: ignore
+except Exception:
+    zstd = None
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "content/databases/exports")
+SNAP_DIR = os.environ.get("SNAPSHOT_DIR", "content/databases/snapshots")
+CHUNK_ROWS = int(os.environ.get("SNAPSHOT_CHUNK_ROWS", "256"))  # average rows per chunk
+ZSTD_LEVEL = int(os.environ.get("SNAPSHOT_ZSTD_LEVEL", "10"))
+ID_COL = "_page_id"
+
+csv.field_size_limit(sys.maxsize)
+
+def log(m: str) -> None:
+    print(f"[snapshot] {m}", flush=True)
+
+def _require_zstd() -> None:
+    if zstd is None:
+        raise SystemExit("zstandard not installed (pip install zstandard)")
+
+def chunk_path(cid: str) -> str:
+    return os.path.join(SNAP_DIR, "chunks", cid[:2], f"{cid}.csv.zst")
+
+def manifest_dir(date: str) -> str:
+    return os.path.join(SNAP_DIR, "manifests", date)
+
+def _atomic_write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _is_boundary(key: str) -> bool:
+    h = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(h, "big") % CHUNK_ROWS == 0
+
+def chunk_rows(rows: Iterable[List[str]], key_idx: int) -> Iterator[bytes]:
+    """Serialized CSV chunks, cut after rows whose key hits the boundary (or at 4x the average size)."""
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    n = 0
+    for row in rows:
+        w.writerow(row)
+        n += 1
+        if _is_boundary(row[key_idx]) or n >= 4 * CHUNK_ROWS:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+            n = 0
+    if n:
+        yield buf.getvalue().encode("utf-8")
+
+def put_chunk(data: bytes, cctx: Any) -> Tuple[str, bool]:
+    """Store a chunk under its sha256 unless already present; returns (id, newly written)."""
+    cid = hashlib.sha256(data).hexdigest()
+    path = chunk_path(cid)
+    if os.path.exists(path):
+        return cid, False
+    _atomic_write(path, cctx.compress(data))
+    return cid, True
+
+def snapshot_csv(path: str, date: str, cctx: Any) -> Dict[str, Any]:
+    title = os.path.splitext(os.path.basename(path))[0]
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        r = csv.reader(f)
+        header = next(r, [])
+        rows = [row for row in r if row]
+    # page id when present (export.py format), otherwise the first column
+    key_idx = header.index(ID_COL) if ID_COL in header else 0
+    rows.sort(key=lambda row: row[key_idx])
+    chunks, new = [], 0
+    for data in chunk_rows(rows, key_idx):
+        cid, written = put_chunk(data, cctx)
+        chunks.append(cid)
+        new += written
+    manifest = {"database": title, "date": date, "source": os.path.basename(path),
+                "header": header, "key": header[key_idx] if header else None,
+                "rows": len(rows), "chunks": chunks}
+    _atomic_write(os.path.join(manifest_dir(date), f"{title}.json"),
+                  json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+    log(f"{title}: {len(rows)} rows, {len(chunks)} chunks ({new} new)")
+    return manifest
+
+def snapshot(src_dir: str, date: str) -> None:
+    _require_zstd()
+    if not os.path.isdir(src_dir):
+        raise SystemExit(f"No exports in {src_dir}")
+    cctx = zstd.ZstdCompressor(level=ZSTD_LEVEL)
+    names = sorted(n for n in os.listdir(src_dir) if n.endswith(".csv"))
+    for name in names:
+        snapshot_csv(os.path.join(src_dir, name), date, cctx)
+    # a database that disappeared from the export must not linger in the day's manifests
+    keep = {os.path.splitext(n)[0] + ".json" for n in names}
+    for stale in set(os.listdir(manifest_dir(date)) if os.path.isdir(manifest_dir(date)) else []) - keep:
+        os.remove(os.path.join(manifest_dir(date), stale))
+
+def dates() -> List[str]:
+    root = os.path.join(SNAP_DIR, "manifests")
+    return sorted(os.listdir(root)) if os.path.isdir(root) else []
+
+def resolve_date(date: str) -> str:
+    known = dates()
+    if not known:
+        raise SystemExit(f"No snapshots in {SNAP_DIR}")
+    if date == "latest":
+        return known[-1]
+    if date not in known:
+        raise SystemExit(f"No snapshot for {date} (have {known[0]} .. {known[-1]})")
+    return date
+
+def load_manifests(date: str) -> List[Dict[str, Any]]:
+    d = manifest_dir(date)
+    out = []
+    for name in sorted(os.listdir(d)):
+        with open(os.path.join(d, name), "r", encoding="utf-8") as f:
+            out.append(json.load(f))
+    return out
+
+def read_chunk(cid: str, dctx: Any) -> bytes:
+    with open(chunk_path(cid), "rb") as f:
+        data = dctx.decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != cid:
+        raise SystemExit(f"Chunk {cid} is corrupt")
+    return data
+
+def restore(date: str, out_dir: str, only: Optional[List[str]] = None) -> None:
+    _require_zstd()
+    date = resolve_date(date)
+    dctx = zstd.ZstdDecompressor()
+    os.makedirs(out_dir, exist_ok=True)
+    for m in load_manifests(date):
+        if only and m["database"] not in only:
+            continue
+        path = os.path.join(out_dir, m.get("source") or f"{m['database']}.csv")
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerow(m["header"])
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf.getvalue().encode("utf-8"))
+            for cid in m["chunks"]:
+                f.write(read_chunk(cid, dctx))
+        os.replace(tmp, path)
+        log(f"{m['database']}: restored {m['rows']} rows from {date} -> {path}")
+
+def gc() -> None:
+    """Delete chunks no manifest refers to (after manifests were pruned by hand)."""
+    live = {cid for d in dates() for m in load_manifests(d) for cid in m["chunks"]}
+    root = os.path.join(SNAP_DIR, "chunks")
+    removed = 0
+    for sub in (os.listdir(root) if os.path.isdir(root) else []):
+        for name in os.listdir(os.path.join(root, sub)):
+            if name.split(".", 1)[0] not in live:
+                os.remove(os.path.join(root, sub, name))
+                removed += 1
+    log(f"removed {removed} unreferenced chunk(s)")
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("snapshot", help="snapshot the current CSV exports")
+    s.add_argument("--src", default=EXPORT_DIR)
+    s.add_argument("--date", default=datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+    r = sub.add_parser("restore", help="rebuild a date's CSVs from its manifests")
+    r.add_argument("--date", default="latest")
+    r.add_argument("--out", default=EXPORT_DIR)
+    r.add_argument("--database", action="append", default=[], help="only this database title (repeatable)")
+    sub.add_parser("list", help="list snapshot dates")
+    sub.add_parser("gc", help="delete unreferenced chunks")
+    d = sub.add_parser("diff", help="row-level diff of two snapshot dates (or CSV directories)")
+    d.add_argument("old", help="date, 'latest' or a directory of CSVs")
+    d.add_argument("new", nargs="?", default=EXPORT_DIR)
+    d.add_argument("--key", default="auto", help="page, unique (schemas/databases.yml) or a column name; auto = page id when present")
+    d.add_argument("--database", action="append", default=[], help="only this database title (repeatable)")
+    d.add_argument("--json", action="store_true", help="one JSON object per change, then a summary per database")
+    d.add_argument("--limit", type=int, default=20, help="rows listed per database in text output")
+    d.add_argument("--exit-code", action="store_true", help="exit 1 when there are differences")
+    args = ap.parse_args()
+    if args.cmd == "snapshot":
+        snapshot(args.src, args.date)
+    elif args.cmd == "restore":
+        restore(args.date, args.out, args.database)
+    elif args.cmd == "list":
+        for d in dates():
+            ms = load_manifests(d)
+            print(f"{d}  {len(ms)} database(s)  {sum(m['rows'] for m in ms)} rows")
+    elif args.cmd == "diff":
+        from snapshot_diff import run
+        changed = run(args.old, args.new, args.key, args.database, args.json, args.limit)
+        if args.exit_code and changed:
+            raise SystemExit(1)
+    else:
+        gc()
+
+if __name__ == "__main__":
+    main()
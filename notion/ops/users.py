@@ -0,0 +1,84 @@
+"""Workspace user directory for filling people properties from names or emails.
+
+users.list is read once (all pages) and cached in NOTION_USERS_CACHE for NOTION_USERS_TTL seconds,
+so resolving a row's people costs no API call. A name that is not in a cache loaded from disk
+triggers one refresh per process (someone may have joined since). Names shared by several users
+are ambiguous and never resolve; use the email instead.
+"""
+import os, json, time, threading
+from typing import Any, Dict, List, Optional
+
+from notion_client.helpers import iterate_paginated_api
+
+from ratelimit import limited
+
+USERS_CACHE = os.environ.get("NOTION_USERS_CACHE", ".notion_users.json")
+USERS_TTL = float(os.environ.get("NOTION_USERS_TTL", "86400"))
+
+def log(m: str) -> None:
+    print(f"[users] {m}", flush=True)
+
+class UserDirectory:
+    def __init__(self, client: Any, path: str = USERS_CACHE, ttl: float = USERS_TTL) -> None:
+        self.list_users = limited(client.users.list)
+        self.path, self.ttl = path, ttl
+        self.lock = threading.Lock()
+        self.by_name: Optional[Dict[str, Optional[str]]] = None
+        self.fetched = False  # loaded from the API in this process
+        self.unknown: set = set()
+
+    def _fetch(self) -> List[Dict[str, str]]:
+        users = [{"id": u["id"], "name": u.get("name") or "", "email": (u.get("person") or {}).get("email") or ""}
+                 for u in iterate_paginated_api(self.list_users, page_size=100)]
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": time.time(), "users": users}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+        self.fetched = True
+        log(f"loaded {len(users)} user(s)")
+        return users
+
+    def _cached(self) -> Optional[List[Dict[str, str]]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - data.get("fetched_at", 0) > self.ttl:
+            return None
+        return data.get("users")
+
+    def _index(self, users: List[Dict[str, str]]) -> None:
+        by_name: Dict[str, Optional[str]] = {}
+        for u in users:
+            by_name[u["id"]] = u["id"]
+            if u["email"]:
+                by_name[u["email"].lower()] = u["id"]
+        for u in users:
+            name = u["name"].strip().lower()
+            if name and name not in by_name:
+                by_name[name] = u["id"]
+            elif name and by_name[name] != u["id"]:
+                by_name[name] = None  # ambiguous
+        self.by_name = by_name
+
+    def resolve(self, value: str) -> Optional[str]:
+        """User id for a name, email or id; None when unknown or ambiguous."""
+        key = value.strip().lower()
+        with self.lock:
+            if self.by_name is None:
+                users = self._cached()
+                self._index(users if users is not None else self._fetch())
+            if key not in self.by_name and not self.fetched:
+                self._index(self._fetch())
+            uid = self.by_name.get(key)
+            if uid is None and key not in self.unknown:
+                self.unknown.add(key)
+                log(f"no {'unique ' if key in self.by_name else ''}user for {value!r}")
+        return uid
+
+    def people(self, value: Any) -> List[Dict[str, str]]:
+        """A people property value from a list or a comma/semicolon separated string; unknown names are dropped."""
+        names = value if isinstance(value, (list, tuple)) else str(value or "").replace(";", ",").split(",")
+        ids = [self.resolve(str(n)) for n in names if str(n).strip()]
+        return [{"object": "user", "id": uid} for uid in dict.fromkeys(i for i in ids if i)]
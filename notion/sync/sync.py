@@ -1,10 +1,13 @@
 # notion/sync/sync.py
-import os, csv, glob, time, re
+import os, sys, csv, glob, time, re
 from typing import Optional, Dict, Any, List, Tuple
 from notion_client import Client
 from notion_client.helpers import iterate_paginated_api
 from notion_client.errors import APIResponseError
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ops"))
+from users import UserDirectory  # noqa: E402
+
 NOTION_TOKEN = os.environ.get("NOTION_TOKEN", "")
 ROOT_PAGE_ID = os.environ.get("ROOT_PAGE_ID", "")
 CONTENT_DIR  = os.environ.get("CONTENT_DIR", "content/databases")
@@ -16,6 +19,7 @@ if not ROOT_PAGE_ID:
     raise SystemExit("Missing ROOT_PAGE_ID")
 
 notion = Client(auth=NOTION_TOKEN)
+users = UserDirectory(notion)  # تُحمّل عند أول عمود people فقط
 
 def log(msg: str) -> None:
     print(f"[sync] {time.strftime('%H:%M:%S')} {msg}", flush=True)
@@ -181,6 +185,10 @@ def _row_props(db_id: str, title_prop: str, row: Dict[str, str], prop_types: Dic
             props[k] = {"email": v or None}
         elif ptype == "phone_number":
             props[k] = {"phone_number": v or None}
+        elif ptype == "people":
+            people = users.people(v)
+            if people or not v.strip():
+                props[k] = {"people": people}
         else:
             props[k] = {"rich_text": [{"type": "text", "text": {"content": v}}]}
     return props
@@ -1,27 +1,48 @@
-import os, json, sys, time
+"""Quick add: one row from PROPS_JSON, or a batch of rows (JSONL/CSV) from a file or stdin.
+
+    DB_TITLE=Tasks PROPS_JSON='{"Name": "x"}' python notion/tools/add_page.py
+    DB_TITLE=Tasks python notion/tools/add_page.py --batch rows.jsonl   # or rows.csv, or - for stdin
+
+The database is resolved once per process: DB_ID pins it, otherwise the title is looked up with a
+paginated search, keeping only databases whose parent chain reaches ROOT_PAGE_ID (at any depth),
+and the id is cached in QUICK_ADD_CACHE. Rows are encoded with
+an encoder built once from the database schema and created concurrently (QUICK_ADD_WORKERS),
+paced by the shared rate limiter.
+"""
+import os, csv, json, sys, time, argparse
+from concurrent.futures import ThreadPoolExecutor
 from notion_client import Client
+from notion_client.helpers import iterate_paginated_api
+from notion_client.errors import APIResponseError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ops"))
+from ratelimit import limited  # noqa: E402
+from users import UserDirectory  # noqa: E402
 
 token = os.environ.get("NOTION_TOKEN","")
 root  = os.environ.get("ROOT_PAGE_ID","")
 title = os.environ.get("DB_TITLE","").strip()
+db_id = os.environ.get("DB_ID","").strip()
 props_json = os.environ.get("PROPS_JSON","{}")
+CACHE_FILE = os.environ.get("QUICK_ADD_CACHE", ".quick_add_cache.json")
+WORKERS = int(os.environ.get("QUICK_ADD_WORKERS", "4"))
 
-if not token or not root or not title:
-    print("[quick-add] Missing env (NOTION_TOKEN/ROOT_PAGE_ID/DB_TITLE)"); sys.exit(1)
-
-try:
-    user_props = json.loads(props_json)
-except Exception as e:
-    print(f"[quick-add] Bad JSON: {e}"); sys.exit(1)
+if not token or not (db_id or (root and title)):
+    print("[quick-add] Missing env (NOTION_TOKEN and DB_ID, or ROOT_PAGE_ID/DB_TITLE)"); sys.exit(1)
 
 notion = Client(auth=token)
+search = limited(notion.search)
+retrieve_db = limited(notion.databases.retrieve)
+retrieve_page = limited(notion.pages.retrieve)
+retrieve_block = limited(notion.blocks.retrieve)
+create_page = limited(notion.pages.create)
+users = UserDirectory(notion)
 
 def pt(text): return [{"type":"text","text":{"content":str(text)}}]
 
-def norm_props(db, user_props):
-    """حوّل dict بسيط إلى خصائص Notion الصحيحة بحسب أنواع الحقول.
+def make_encoder(db):
+    """دالة تحوّل dict بسيط إلى خصائص Notion حسب أنواع الحقول؛ تُبنى مرة واحدة لكل مخطط.
        العنوان نبحث عنه تلقائيًا (أول حقل type=title). بقية الحقول تُعبّأ كـ rich_text افتراضيًا."""
-    props = {}
     db_props = db.get("properties",{})
     title_prop_name = None
     for k,v in db_props.items():
@@ -30,53 +51,162 @@ def norm_props(db, user_props):
     if not title_prop_name:
         # fallback اسم شائع
         title_prop_name = "Name"
+    types = {k: v.get("type","rich_text") for k,v in db_props.items()}
+
+    def encode(user_props):
+        props = {}
+        # عين العنوان
+        title_val = user_props.get("Name") or user_props.get("Title") or user_props.get(title_prop_name) or "New Page"
+        props[title_prop_name] = {"title": pt(title_val)}
 
-    # عين العنوان
-    title_val = user_props.get("Name") or user_props.get("Title") or user_props.get(title_prop_name) or "New Page"
-    props[title_prop_name] = {"title": pt(title_val)}
-
-    # بقية الحقول
-    for k,v in user_props.items():
-        if k == title_prop_name: 
-            continue
-        meta = db_props.get(k, {"type":"rich_text"})
-        t = meta.get("type","rich_text")
-        if t == "select":
-            props[k] = {"select": {"name": str(v)}}
-        elif t == "multi_select":
-            if isinstance(v, (list, tuple)):
-                props[k] = {"multi_select": [{"name": str(x)} for x in v]}
+        # بقية الحقول
+        for k,v in user_props.items():
+            if k == title_prop_name:
+                continue
+            t = types.get(k, "rich_text")
+            if t == "select":
+                props[k] = {"select": {"name": str(v)}}
+            elif t == "multi_select":
+                if isinstance(v, (list, tuple)):
+                    props[k] = {"multi_select": [{"name": str(x)} for x in v]}
+                else:
+                    props[k] = {"multi_select": [{"name": str(v)}]}
+            elif t == "status":
+                props[k] = {"status": {"name": str(v)}}
+            elif t == "people":
+                # أسماء/إيميلات → معرّفات من دليل المستخدمين المخزّن؛ غير المعروف يُتجاهل
+                people = users.people(v)
+                if people:
+                    props[k] = {"people": people}
             else:
-                props[k] = {"multi_select": [{"name": str(v)}]}
-        elif t == "status":
-            props[k] = {"status": {"name": str(v)}}
-        elif t == "people":
-            # بدون lookups لناس محددين: فقط نتجاهله افتراضيًا
-            continue
-        else:
-            props[k] = {"rich_text": pt(v)}
-    return props
+                props[k] = {"rich_text": pt(v)}
+        return props
+    return encode
+
+def norm_props(db, user_props):
+    return make_encoder(db)(user_props)
+
+def _load_cache():
+    try:
+        with open(CACHE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache):
+    tmp = f"{CACHE_FILE}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, CACHE_FILE)
+
+def same_id(a, b):
+    # ROOT_PAGE_ID يُكتب غالبًا بلا شرطات، والـ API يعيد UUID بشرطات
+    return a.replace("-","").lower() == b.replace("-","").lower()
+
+RETRIEVE = {"page_id": lambda i: retrieve_page(page_id=i),
+            "block_id": lambda i: retrieve_block(block_id=i),
+            "database_id": lambda i: retrieve_db(database_id=i)}
+
+_PARENTS = {}  # id -> its parent, for the chains walked by under_root
+
+def under_root(obj):
+    """True when obj's parent chain (pages, blocks, databases) reaches ROOT_PAGE_ID."""
+    parent = obj.get("parent",{})
+    while parent.get("type") in RETRIEVE:
+        pid = parent[parent["type"]]
+        if same_id(pid, root):
+            return True
+        if pid not in _PARENTS:
+            _PARENTS[pid] = RETRIEVE[parent["type"]](pid).get("parent",{})
+        parent = _PARENTS[pid]
+    return False  # وصلنا إلى workspace دون المرور بالجذر
 
 def find_db_by_title(t):
-    resp = notion.search(query=t, filter={"value":"database","property":"object"})
-    for obj in resp.get("results", []):
+    # كل صفحات نتائج البحث، لا الأولى فقط؛ البحث يشمل مساحة العمل كلها فنتحقق من الجذر بأنفسنا
+    for obj in iterate_paginated_api(search, query=t, filter={"value":"database","property":"object"}):
         if obj.get("object")=="database":
             # طابق العنوان
             title_arr = obj.get("title",[])
             plain = title_arr[0]["plain_text"] if title_arr and "plain_text" in title_arr[0] else ""
-            # ضمن الجذر؟
-            parent = obj.get("parent",{})
-            under_root = parent.get("type")=="page_id" and parent.get("page_id")==root
-            if plain==t and under_root:
+            if plain==t and under_root(obj):
                 return obj
     return None
 
-def main():
+def resolve_db():
+    """DB_ID if pinned, else the cached id for (root, title), else a paginated search (then cached)."""
+    if db_id:
+        return retrieve_db(database_id=db_id)
+    key = f"{root}/{title}"
+    cache = _load_cache()
+    if cache.get(key):
+        try:
+            return retrieve_db(database_id=cache[key])
+        except APIResponseError as e:
+            print(f"[quick-add] Cached id for {title} is stale ({e.code}), searching again")
     db = find_db_by_title(title)
+    if db:
+        cache[key] = db["id"]
+        _save_cache(cache)
+    return db
+
+def read_rows(path, as_csv=False):
+    """Rows from a .csv (empty cells dropped) or JSON-lines file; '-' reads stdin."""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8-sig", newline="")
+    try:
+        if path.endswith(".csv") or as_csv:
+            for row in csv.DictReader(f):
+                yield {k: v for k, v in row.items() if k and v not in (None, "")}
+        else:
+            for n, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        raise SystemExit(f"[quick-add] {path}:{n}: bad JSON ({e})")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def add_batch(db, path, workers=WORKERS, as_csv=False):
+    encode = make_encoder(db)
+    parent = {"database_id": db["id"]}
+    started = time.monotonic()
+
+    def add(item):
+        n, row = item
+        try:
+            create_page(parent=parent, properties=encode(row))
+            return None
+        except Exception as e:
+            return f"row {n}: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        results = list(ex.map(add, enumerate(read_rows(path, as_csv), 1)))
+    failed = [r for r in results if r]
+    for r in failed:
+        print(f"[quick-add] FAILED {r}")
+    elapsed = time.monotonic() - started
+    print(f"[quick-add] Added {len(results) - len(failed)}/{len(results)} in {elapsed:.1f}s")
+    return failed
+
+def main():
+    ap = argparse.ArgumentParser(description="Add pages to a Notion database.")
+    ap.add_argument("--batch", help="JSONL or CSV file of rows, '-' for stdin")
+    ap.add_argument("--csv", action="store_true", help="stdin batch is CSV (default JSONL)")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    args = ap.parse_args()
+    db = resolve_db()
     if not db:
         print(f"[quick-add] DB not found under ROOT: {title}"); sys.exit(1)
-    props = norm_props(db, user_props)
-    notion.pages.create(parent={"database_id": db["id"]}, properties=props)
+    if args.batch:
+        if add_batch(db, args.batch, args.workers, args.csv):
+            sys.exit(1)
+        return
+    try:
+        user_props = json.loads(props_json)
+    except Exception as e:
+        print(f"[quick-add] Bad JSON: {e}"); sys.exit(1)
+    create_page(parent={"database_id": db["id"]}, properties=norm_props(db, user_props))
     print("[quick-add] Added ✔")
 
 if __name__ == "__main__":
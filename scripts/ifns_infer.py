@@ -0,0 +1,86 @@
+"""
+Data-driven Notion property types for IFNS CSV columns.
+
+Every non-empty value of a column is checked with vectorized pandas string/number/datetime
+tests (the whole column, so the type chosen converts every cell), in this order:
+    checkbox  true/false/yes/no values
+    number    numeric after stripping thousands separators, % and spaces
+    date      date-like text that parses as a datetime
+    url       http(s) links
+    select    short, repeating values (enum)
+    rich_text everything else
+Empty columns (header-only CSVs) fall back to name hints. Explicit overrides from config win.
+Results are cached per file content hash so unchanged CSVs are not re-inferred.
+"""
+import re, hashlib
+from typing import Dict, Optional
+import pandas as pd
+
+ENUM_MAX_DISTINCT = 25
+BOOL_VALUES = {"true", "false", "yes", "no", "y", "n"}
+DATE_RE = r"^\s*\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}"
+URL_RE = r"^https?://\S+$"
+NUMBER_JUNK_RE = r"[,%\s]"
+
+NAME_HINTS = [
+    ("date", {"date", "timestamp", "time", "updated", "created", "due"}),
+    ("select", {"status", "phase", "priority", "severity", "mode", "side"}),
+    ("number", {"sharpe", "drawdown", "slippage", "return", "cagr", "maxdd", "%", "bps", "qty", "price", "capital", "weight", "trades"}),
+    ("checkbox", {"detected", "enabled", "is"}),
+    ("url", {"link", "url"}),
+]
+
+def to_number(s: pd.Series) -> pd.Series:
+    """Numeric view of a column ("1,250", "12.5%", " 3 " -> floats); unparseable cells become NaN."""
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype(float)
+    return pd.to_numeric(s.astype("string").str.replace(NUMBER_JUNK_RE, "", regex=True), errors="coerce").astype(float)
+
+def to_datetime(s: pd.Series) -> pd.Series:
+    """Datetime view of a column, each cell parsed on its own ("2024-03-01" and "2024-03-01 10:15" mix); unparseable cells become NaT."""
+    return pd.to_datetime(s, errors="coerce", format="mixed")
+
+def name_hint(column: str) -> str:
+    words = set(re.findall(r"[a-z]+|%", column.lower()))
+    for t, needles in NAME_HINTS:
+        if words & needles: return t
+    return "rich_text"
+
+def infer_column(s: pd.Series) -> str:
+    v = s.dropna()
+    if v.empty: return name_hint(str(s.name))
+    if pd.api.types.is_bool_dtype(v): return "checkbox"
+    if pd.api.types.is_numeric_dtype(v): return "number"
+    if pd.api.types.is_datetime64_any_dtype(v): return "date"
+    txt = v.astype("string").str.strip()
+    txt = txt[txt != ""]
+    if txt.empty: return name_hint(str(s.name))
+    if txt.str.lower().isin(BOOL_VALUES).all(): return "checkbox"
+    if to_number(txt).notna().all(): return "number"
+    if txt.str.match(DATE_RE).all() and to_datetime(txt).notna().all(): return "date"
+    if txt.str.match(URL_RE).all(): return "url"
+    distinct = txt.nunique()
+    if distinct <= ENUM_MAX_DISTINCT and distinct < len(txt) and txt.str.len().max() <= 100 and not txt.str.contains(",").any():
+        return "select"
+    return "rich_text"
+
+def infer_types(df: pd.DataFrame, overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    types = {c: infer_column(df[c]) for c in df.columns}
+    types.update({c: t for c, t in (overrides or {}).items() if c in types})
+    return types
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""): h.update(chunk)
+    return h.hexdigest()
+
+def cached_infer(df: pd.DataFrame, path: str, overrides: Optional[Dict[str, str]], cache: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+    """infer_types() memoized in `cache` (e.g. a section of the sync state) under the file's content hash."""
+    key = file_hash(path)
+    if key not in cache:
+        cache.clear()  # one entry per file: only the current content is worth keeping
+        cache[key] = infer_types(df)
+    types = dict(cache[key])
+    types.update({c: t for c, t in (overrides or {}).items() if c in types})
+    return types
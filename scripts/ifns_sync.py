@@ -1,46 +1,312 @@
-import os, json, argparse, requests, time, pandas as pd
+import os, sys, gc, json, hashlib, argparse, requests, numpy as np, pandas as pd
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ifns_tail import load_state, save_state, read_tail
+from ifns_infer import infer_types, cached_infer, to_number, to_datetime
 API = "https://api.notion.com/v1"
+WORKERS = int(os.getenv("IFNS_SYNC_WORKERS", "4"))
 def hdrs(token): return {"Authorization": f"Bearer {token}","Notion-Version":"2022-06-28","Content-Type":"application/json"}
 
+# one pacing implementation for every Notion client in the repo (NOTION_RATE_LIMIT, default 3 req/s)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notion", "ops"))
+from ratelimit import LIMITER  # noqa: E402
+
+def api(method, token, path, payload=None, retries=5):
+    for attempt in range(retries):
+        LIMITER.wait()
+        r = requests.request(method, f"{API}/{path}", headers=hdrs(token), json=payload, timeout=60)
+        if r.status_code == 429 or r.status_code >= 500:
+            LIMITER.backoff(float(r.headers.get("Retry-After", 2 ** attempt))); continue
+        r.raise_for_status(); return r.json()
+    r.raise_for_status(); return r.json()
+
 def create_page(token, parent_id, title):
     data = {"parent":{"type":"page_id","page_id": parent_id},"properties":{"title":{"title":[{"text":{"content": title}}]}}}
-    r = requests.post(f"{API}/pages", headers=hdrs(token), json=data, timeout=60); r.raise_for_status(); return r.json()["id"]
+    return api("POST", token, "pages", data)["id"]
+
+def column_types(df, d=None, entry=None):
+    """Inferred Notion types (see ifns_infer) with the database's "types" overrides; cached per file hash when entry is given."""
+    overrides = (d or {}).get("types")
+    if d and entry is not None: return cached_infer(df, d["source"], overrides, entry.setdefault("inferred", {}))
+    return infer_types(df, overrides)
+
+def fragments(values, t):
+    """Notion property values for a list of distinct (already typed) cells, one comprehension per type."""
+    if t == "number": return [{"number": v} for v in values]
+    if t == "date": return [{"date": {"start": v}} for v in values]
+    if t == "checkbox": return [{"checkbox": str(v).strip().lower() in ("1", "true", "yes", "y")} for v in values]
+    values = [str(v)[:2000] for v in values]
+    if t in ("select", "status"): return [{t: {"name": v.replace(",", " ")[:100]}} for v in values]
+    if t == "multi_select": return [{t: [{"name": x.strip()[:100]} for x in v.split(",") if x.strip()]} for v in values]
+    if t == "url": return [{"url": v} for v in values]
+    if t == "title": return [{"title": [{"text": {"content": v}}]} for v in values]
+    return [{"rich_text": [{"text": {"content": v}}]} for v in values]
+
+def column_fragments(s, t):
+    """Convert one column at once: type it, factorize it, build one fragment per distinct value, then take()."""
+    if t in ("number", "date"):
+        typed = to_number(s) if t == "number" else to_datetime(s)
+        lost = typed.isna() & s.notna() & (s.astype("string").str.strip() != "")
+        if lost.any():  # only reachable through a "types" override: inference checks every cell
+            print(f"  ! {s.name}: {int(lost.sum())} value(s) are not {t}s and are left empty, e.g. {s[lost].iloc[0]!r}")
+    if t == "number":
+        s = typed
+    elif t == "date":
+        d = typed; ok = d.dropna()
+        unit = "D" if (ok == ok.dt.normalize()).all() else "s"
+        s = pd.Series(d.to_numpy().astype(f"datetime64[{unit}]").astype(str), index=d.index).where(d.notna())
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    frags = np.empty(len(uniques) + 1, dtype=object)  # last slot stays None for the -1 (missing) code
+    frags[:-1] = fragments(uniques.tolist(), t)
+    return frags[codes].tolist()
+
+def build_properties(df, types):
+    """Column-wise property building: each column is converted once, then the columns are zipped into rows."""
+    gc_was_on = gc.isenabled(); gc.disable()  # only acyclic dicts are built here; skip the collector's rescans
+    try:
+        cols = [(c, column_fragments(df[c], types.get(c, "rich_text"))) for c in df.columns]
+        dense = [(c, f) for c, f in cols if None not in f]
+        names = [c for c, _ in dense]
+        rows = [dict(zip(names, r)) for r in zip(*(f for _, f in dense))] if dense else [{} for _ in range(len(df))]
+        for c, f in cols:
+            if c in names: continue
+            for props, v in zip(rows, f):
+                if v is not None: props[c] = v
+        return rows
+    finally:
+        if gc_was_on: gc.enable()
+
+def build_payloads(db_id, df, types):
+    parent = {"database_id": db_id}
+    return [{"parent": parent, "properties": props} for props in build_properties(df, types)]
+
+def send_all(token, requests_, workers=WORKERS):
+    """Run (method, path, payload) requests concurrently; pacing comes from the shared LIMITER, not the worker count."""
+    if not requests_: return []
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(lambda q: api(q[0], token, q[1], q[2]), requests_))
+
+def send_each(token, requests_, workers=WORKERS):
+    """Like send_all(), but yields (position, response) as each request completes. A failed request
+    does not stop the others; the first error is raised once they are done, after every success was yielded."""
+    if not requests_: return
+    errors = []
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futs = {ex.submit(api, q[0], token, q[1], q[2]): n for n, q in enumerate(requests_)}
+        for fut in as_completed(futs):
+            if fut.exception() is not None: errors.append(fut.exception()); continue
+            yield futs[fut], fut.result()
+    if errors:
+        print(f"  {len(errors)}/{len(requests_)} request(s) failed"); raise errors[0]
+
+def send_pages(token, payloads, workers=WORKERS):
+    return len(send_all(token, [("POST", "pages", p) for p in payloads], workers))
+
+def post_rows(token, db_id, df, types=None):
+    return send_pages(token, build_payloads(db_id, df, types or column_types(df)))
+
+# ---------- Resolution (pinned id -> state -> title -> create) ----------
+def list_children(token, block_id):
+    """{title: id} for child pages/databases directly under block_id."""
+    out, cursor = {}, None
+    while True:
+        data = api("GET", token, f"blocks/{block_id}/children?page_size=100" + (f"&start_cursor={cursor}" if cursor else ""))
+        for b in data.get("results", []):
+            if b.get("type") in ("child_page", "child_database"):
+                out.setdefault(b[b["type"]].get("title", "").strip(), b["id"])
+        if not data.get("has_more"): return out
+        cursor = data.get("next_cursor")
+
+def resolve(pinned, cached, title, children):
+    if pinned: return pinned
+    if cached and cached in children.values(): return cached
+    return children.get(title.strip())
+
+def ensure_page(token, parent_id, title, pinned, cached, children):
+    pid = resolve(pinned, cached, title, children)
+    if pid: return pid
+    print(f"+ page: {title}"); return create_page(token, parent_id, title)
+
+def key_columns(d, df):
+    """Row key from config ("key": column or list of columns), else the first column. The first key column is the title."""
+    k = d.get("key") or df.columns[0]
+    return [k] if isinstance(k, str) else list(k)
+
+def row_key(props, keys):
+    vals = [plain(props.get(k)) for k in keys]
+    return None if any(v in (None, "") for v in vals) else "\x1f".join(str(v) for v in vals)
+
+def db_types(inferred, keys):
+    types = dict(inferred); types[keys[0]] = "title"
+    return types
+
+def create_db(token, parent_id, title, types):
+    props = {c: {t:{}} for c, t in types.items()}
+    data = {"parent":{"type":"page_id","page_id": parent_id},"title":[{"type":"text","text":{"content": title}}],"properties":props}
+    return api("POST", token, "databases", data)["id"]
+
+def reconcile_schema(token, db_id, df, inferred):
+    """Add CSV columns missing from the database; existing property types win. Returns {column: notion type}."""
+    db = api("GET", token, f"databases/{db_id}")
+    have = {name: meta.get("type") for name, meta in db.get("properties", {}).items()}
+    missing = {c: {inferred[c]: {}} for c in df.columns if c not in have}
+    if missing:
+        print(f"~ schema {db_id}: adding {list(missing)}")
+        api("PATCH", token, f"databases/{db_id}", {"properties": missing})
+    return {c: have.get(c, inferred[c]) for c in df.columns}
+
+def cached_schema(token, db_id, df, entry, inferred):
+    """Reconcile only when the database or the CSV header changed since the last run."""
+    if entry.get("db_id") == db_id and entry.get("columns") == list(df.columns): return entry["types"]
+    types = reconcile_schema(token, db_id, df, inferred)
+    entry.update({"columns": list(df.columns), "types": types})
+    return types
+
+def ensure_db(token, parent_id, d, types, cached, children):
+    db_id = resolve(d.get("id"), cached, d["title"], children)
+    if not db_id:
+        print(f"+ database: {d['title']}")
+        return create_db(token, parent_id, d["title"], types), True
+    return db_id, False
+
+# ---------- Keyed row sync ----------
+def plain(v):
+    """Comparable plain value of a property, from our fragments and from Notion pages alike."""
+    if not v: return None
+    t = v.get("type") or next(iter(v))
+    x = v.get(t)
+    if t in ("title", "rich_text"): return "".join(r.get("plain_text") or r.get("text", {}).get("content", "") for r in x or [])
+    if t in ("select", "status"): return (x or {}).get("name")
+    if t == "multi_select": return sorted(o.get("name") for o in x or [])
+    if t == "date": return canonical_date((x or {}).get("start"))
+    if t == "number": return None if x is None else float(x)
+    return x
+
+def canonical_date(s):
+    """"2024-03-01T10:15:00" (what we send) and "2024-03-01T10:15:00.000+00:00" (what Notion returns) -> one UTC ISO form."""
+    if not s or "T" not in s: return s
+    try: d = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except ValueError: return s
+    d = d.replace(tzinfo=timezone.utc) if d.tzinfo is None else d.astimezone(timezone.utc)
+    return d.isoformat(timespec="seconds")
+
+def signature(props, cols):
+    return hashlib.sha1(json.dumps([plain(props.get(c)) for c in cols], sort_keys=True, default=str).encode()).hexdigest()
+
+def notion_index(token, db_id, keys, cols):
+    """{key: [page_id, signature]} from one paginated query (used when no row state is cached)."""
+    out, body = {}, {"page_size": 100}
+    while True:
+        data = api("POST", token, f"databases/{db_id}/query", body)
+        for pg in data.get("results", []):
+            k = row_key(pg["properties"], keys)
+            if k is not None: out.setdefault(k, [pg["id"], signature(pg["properties"], cols)])
+        if not data.get("has_more"): return out
+        body = {"page_size": 100, "start_cursor": data["next_cursor"]}
+
+def sync_rows(token, db_id, df, types, keys, index):
+    """Create new keys, update changed rows, skip unchanged ones; index ({key: [page_id, sig]}) is updated in place,
+    each row as soon as its request succeeds, so a failed run keeps the pages it did create."""
+    cols = list(df.columns); props = build_properties(df, types)
+    reqs, rows = [], []  # rows[n]: (key, signature, page id or None for a create) of reqs[n]
+    for p in props:
+        k = row_key(p, keys)
+        if k is None: continue
+        sig = signature(p, cols)
+        have = index.get(k)
+        if have is None: reqs.append(("POST", "pages", {"parent": {"database_id": db_id}, "properties": p})); rows.append((k, sig, None))
+        elif have[1] != sig: reqs.append(("PATCH", f"pages/{have[0]}", {"properties": p})); rows.append((k, sig, have[0]))
+    creates = sum(1 for r in rows if r[2] is None)
+    print(f"  rows: +{creates} ~{len(rows) - creates} ={len(props) - len(rows)}")
+    for n, pg in send_each(token, reqs):
+        k, sig, page_id = rows[n]; index[k] = [page_id or pg["id"], sig]
+    return index
+
+def sync_db(token, parent_id, d, entry, children):
+    df = pd.read_csv(d["source"]); keys = key_columns(d, df)
+    inferred = column_types(df, d, entry)
+    db_id, created = ensure_db(token, parent_id, d, db_types(inferred, keys), entry.get("db_id"), children)
+    types = db_types(inferred, keys) if created else cached_schema(token, db_id, df, entry, inferred)
+    cached = entry.get("rows") if entry.get("db_id") == db_id else None
+    index = {} if created else (cached if cached is not None else notion_index(token, db_id, keys, list(df.columns)))
+    # stored before syncing: sync_rows fills it in place, so rows sent before a failure are kept
+    entry.update({"db_id": db_id, "columns": list(df.columns), "types": types, "rows": index})
+    sync_rows(token, db_id, df, types, keys, index)
+    return db_id
+
+def post_new_rows(token, db_id, df, types, keys, posted):
+    """Post rows whose key is not in `posted` (a set), adding each key once its page is created."""
+    reqs, ks = [], []
+    for p in build_properties(df, types):
+        k = row_key(p, keys)
+        if k is not None and k in posted: continue
+        reqs.append(("POST", "pages", {"parent": {"database_id": db_id}, "properties": p})); ks.append(k)
+    for n, _ in send_each(token, reqs):
+        if ks[n] is not None: posted.add(ks[n])
+    return len(reqs)
 
 def create_db_from_csv(token, parent_id, title, path):
     df = pd.read_csv(path)
-    props = {}
-    for c in df.columns:
-        t = "rich_text"
-        cl = c.lower()
-        if "date" in cl: t="date"
-        elif any(k in cl for k in ["status","phase","priority"]): t="select"
-        elif any(k in cl for k in ["sharpe","drawdown","slippage","return","cagr","%","bps"]): t="number"
-        props[c] = {t:{}}
-    data = {"parent":{"type":"page_id","page_id": parent_id},"title":[{"type":"text","text":{"content": title}}],"properties":props}
-    r = requests.post(f"{API}/databases", headers=hdrs(token), json=data, timeout=60); r.raise_for_status(); db = r.json()
-    for _, row in df.iterrows():
-        pr = {}
-        for c in df.columns:
-            v = row[c]
-            if pd.isna(v): continue
-            if isinstance(v,(int,float)): pr[c]={"number": float(v)}
-            else: pr[c]={"rich_text":[{"text":{"content": str(v)}}]}
-        rr = requests.post(f"{API}/pages", headers=hdrs(token), json={"parent":{"database_id": db["id"]},"properties": pr}, timeout=60); rr.raise_for_status(); time.sleep(0.1)
-    return db["id"]
+    types = db_types(column_types(df), [df.columns[0]])
+    db_id = create_db(token, parent_id, title, types)
+    post_rows(token, db_id, df, types)
+    return db_id
+
+def sync_tail_db(token, parent_id, d, entry, children):
+    """Append-only logs: push only the rows written since the stored bookmark (keyed full rescan on rewrite).
+
+    The bookmark moves only once every new row is posted. When a push fails part way, the keys of
+    the rows that were posted are kept in entry["posted"] and skipped when the same rows are read again."""
+    db_id = resolve(d.get("id"), entry.get("db_id"), d["title"], children)
+    df, bookmark, full = read_tail(d["source"], entry.get("bookmark") if db_id else None)
+    keys = key_columns(d, df); inferred = column_types(df, d)  # tail slice only: no whole-file hash
+    if not db_id:
+        print(f"+ database: {d['title']}")
+        types = db_types(inferred, keys)
+        db_id = create_db(token, parent_id, d["title"], types)
+        post_rows(token, db_id, df, types)
+        entry.update({"columns": list(df.columns), "types": types})
+    elif full:
+        print(f"[tail] {d['source']}: no valid bookmark (new, truncated or rewritten), keyed full rescan")
+        sync_rows(token, db_id, df, cached_schema(token, db_id, df, entry, inferred), keys, notion_index(token, db_id, keys, list(df.columns)))
+    elif len(df):
+        posted = set(entry.get("posted", []))
+        try:
+            post_new_rows(token, db_id, df, cached_schema(token, db_id, df, entry, inferred), keys, posted)
+        finally:
+            entry["posted"] = sorted(posted)
+    entry.pop("posted", None)
+    entry.update({"db_id": db_id, "bookmark": bookmark})
+    print(f"[tail] {d['title']}: {len(df)} row(s) read")
+    return db_id
 
 def main():
     ap = argparse.ArgumentParser(); ap.add_argument("--config", required=True); args = ap.parse_args()
     with open(args.config,"r",encoding="utf-8") as f: cfg = json.load(f)
     token = os.getenv("NOTION_TOKEN"); root = os.getenv("ROOT_PAGE_ID")
     if not token or not root: raise SystemExit("Missing NOTION_TOKEN/ROOT_PAGE_ID")
-    # create IFNS root
-    data = {"parent":{"type":"page_id","page_id": root},"properties":{"title":{"title":[{"text":{"content": cfg['ifns']['root_title']}}]}}}
-    r = requests.post(f"{API}/pages", headers=hdrs(token), json=data, timeout=60); r.raise_for_status(); ifns_root = r.json()["id"]
+    ifns = cfg["ifns"]
+    state_file = ifns.get("state_file", ".ifns_sync_state.json"); state = load_state(state_file)
+    # IFNS root: pinned id, then cached id, then title under ROOT_PAGE_ID, else create
+    ifns_root = ifns.get("root_id") or ensure_page(token, root, ifns["root_title"], None, state.get("root_id"), list_children(token, root))
+    state["root_id"] = ifns_root
+    children = list_children(token, ifns_root)
     # pages (titles only; content can be added later via block append if needed)
-    for p in cfg["ifns"]["pages"]:
-        create_page(token, ifns_root, p["title"])
-    # databases
-    for d in cfg["ifns"]["databases"]:
-        create_db_from_csv(token, ifns_root, d["title"], d["source"])
+    pages = state.setdefault("pages", {})
+    for p in ifns["pages"]:
+        pages[p["title"]] = ensure_page(token, ifns_root, p["title"], p.get("id"), pages.get(p["title"]), children)
+    save_state(state_file, state)
+    # databases (mode "tail" = append-only log, synced from a per-file bookmark; others synced by key)
+    dbs = state.setdefault("databases", {})
+    for d in ifns["databases"]:
+        entry = dbs.setdefault(d["source"], {})
+        print(f"= {d['title']} <- {d['source']}")
+        try:
+            if d.get("mode") == "tail":
+                sync_tail_db(token, ifns_root, d, entry, children)
+            else:
+                sync_db(token, ifns_root, d, entry, children)
+        finally:
+            save_state(state_file, state)  # also on failure: the rows already sent are recorded
     print("IFNS sync done.")
 if __name__ == "__main__": main()
@@ -0,0 +1,63 @@
+"""
+Append-only tail reader for log-shaped IFNS CSVs (Execution_API_Log, RiskAPI_Alerts, Experiment_Logs).
+
+A bookmark is kept per file:
+    offset      byte offset just past the last consumed (complete) line
+    last_len    length of that line in bytes
+    last_hash   sha1 of that line
+    header_hash sha1 of the CSV header line
+    inode/size  file identity at the time of the last read
+
+On the next run we verify the bookmark (file not shorter than offset, same header,
+same bytes right before offset) and seek straight to the new bytes. Anything else is
+treated as truncation/rewrite and the whole file is rescanned.
+Rows are assumed to be one physical line each (no quoted newlines), which holds for the logs.
+"""
+import os, io, json, hashlib
+from typing import Any, Dict, Optional, Tuple
+import pandas as pd
+
+def _sha1(b: bytes) -> str: return hashlib.sha1(b).hexdigest()
+
+def load_state(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path): return {}
+    with open(path, "r", encoding="utf-8") as f:
+        try: return json.load(f)
+        except ValueError: return {}
+
+def save_state(path: str, state: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def _bookmark_valid(f, st: os.stat_result, header: bytes, bm: Dict[str, Any]) -> bool:
+    off, n = bm.get("offset", 0), bm.get("last_len", 0)
+    if off <= 0 or st.st_size < off: return False            # truncated
+    if bm.get("header_hash") != _sha1(header): return False   # columns changed
+    f.seek(off - n)
+    return _sha1(f.read(n)) == bm.get("last_hash")            # rewritten before the bookmark
+
+def read_tail(path: str, bookmark: Optional[Dict[str, Any]] = None) -> Tuple[pd.DataFrame, Dict[str, Any], bool]:
+    """Return (new_rows, new_bookmark, full_rescan). Only complete lines are consumed."""
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        if not header.endswith(b"\n"):
+            return pd.DataFrame(), dict(bookmark or {}), False  # header still being written
+        full = not (bookmark and _bookmark_valid(f, st, header, bookmark))
+        start = len(header) if full else bookmark["offset"]
+        f.seek(start)
+        data = f.read()
+    end = data.rfind(b"\n") + 1  # leave a partially written last line for the next run
+    body = data[:end]
+    if body:
+        last = body[body.rfind(b"\n", 0, len(body) - 1) + 1:]
+    elif full:
+        last = header
+    else:
+        last = None
+    bm = dict(bookmark or {}) if not full else {}
+    bm.update({"offset": start + end, "header_hash": _sha1(header), "inode": st.st_ino, "size": st.st_size})
+    if last is not None: bm.update({"last_len": len(last), "last_hash": _sha1(last)})
+    df = pd.read_csv(io.BytesIO(header + body))
+    return df, bm, full
@@ -1,4 +1,4 @@
-import os, json, argparse, requests
+import os, json, time, argparse, requests
 from datetime import datetime, timezone
 from dateutil.parser import isoparse
 
@@ -22,11 +22,50 @@ def search_db_by_title(token, title):
                 return res["id"]
     return None
 
-def query_db(token, db_id):
-    payload = {"page_size": 25, "sorts":[{"timestamp":"created_time","direction":"descending"}]}
+def query_db(token, db_id, since=None):
+    """Incidents created at or after `since` (all when None), oldest first, every page of results.
+
+    Notion stores created_time to the minute, so the filter is inclusive and the caller drops
+    the ids it has already seen at the cursor minute."""
+    payload = {"page_size": 100, "sorts": [{"timestamp": "created_time", "direction": "ascending"}]}
+    if since:
+        payload["filter"] = {"timestamp": "created_time", "created_time": {"on_or_after": since}}
+    out = []
+    while True:
+        r = requests.post(f"{API}/databases/{db_id}/query", headers=headers(token), json=payload, timeout=60)
+        r.raise_for_status()
+        data = r.json()
+        out.extend(data.get("results", []))
+        if not data.get("has_more"):
+            return out
+        payload["start_cursor"] = data["next_cursor"]
+
+def latest_incident(token, db_id):
+    payload = {"page_size": 1, "sorts": [{"timestamp": "created_time", "direction": "descending"}]}
     r = requests.post(f"{API}/databases/{db_id}/query", headers=headers(token), json=payload, timeout=60)
     r.raise_for_status()
-    return r.json().get("results", [])
+    results = r.json().get("results", [])
+    return results[0] if results else None
+
+def load_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+def advance(state, page):
+    """Move the cursor to `page`; the seen set only keeps ids at the cursor minute."""
+    created = page["created_time"]
+    if created != state.get("cursor"):
+        state["cursor"], state["seen"] = created, []
+    state["seen"].append(page["id"])
 
 def page_prop(props, name, kind):
     p = props.get(name, {})
@@ -62,20 +101,8 @@ def send_email(subject, body):
     with smtplib.SMTP(host, port) as s:
         s.starttls(context=ctx); s.login(user, pwd); s.sendmail(sender, [to], msg.as_string())
 
-def main():
-    ap = argparse.ArgumentParser(); ap.add_argument("--config", required=True); args = ap.parse_args()
-    token = os.getenv("NOTION_TOKEN"); 
-    if not token: raise SystemExit("Missing NOTION_TOKEN")
-    cfg = json.load(open(args.config,"r",encoding="utf-8"))
-
-    dbid = search_db_by_title(token, cfg["db_names"]["incident_log"])
-    if not dbid: raise SystemExit("Incident Log DB not found")
-
-    results = query_db(token, dbid)
-    if not results: 
-        print("No incidents found"); return
-
-    page = results[0]; pid = page["id"]; props = page["properties"]
+def notify(page):
+    pid = page["id"]; props = page["properties"]
     title = page_prop(props, "title", "title") or "Incident"
     itype = page_prop(props, "Incident Type", "select") or "General"
     severity = page_prop(props, "Severity", "select") or "Info"
@@ -103,5 +130,52 @@ def main():
 
     print("Notification sent for:", title)
 
+def poll(token, state, state_path):
+    """Notify every incident created since the cursor, oldest first; returns how many were sent.
+
+    The state is saved after each notification, so a failed send stops the run with the cursor
+    before that incident (it is retried next time) and nothing already sent is sent again."""
+    seen = set(state.get("seen", []))
+    sent = 0
+    for page in query_db(token, state["db_id"], state.get("cursor")):
+        if page["created_time"] == state.get("cursor") and page["id"] in seen:
+            continue
+        notify(page)
+        advance(state, page)
+        save_state(state_path, state)
+        sent += 1
+    return sent
+
+def main():
+    ap = argparse.ArgumentParser(); ap.add_argument("--config", required=True)
+    ap.add_argument("--interval", type=float, default=0, help="keep polling every N seconds (default: one poll)")
+    ap.add_argument("--backfill", action="store_true", help="on first run, notify existing incidents too")
+    args = ap.parse_args()
+    token = os.getenv("NOTION_TOKEN"); 
+    if not token: raise SystemExit("Missing NOTION_TOKEN")
+    cfg = json.load(open(args.config,"r",encoding="utf-8"))
+    state_path = cfg.get("state_file", ".webhook_state.json")
+    state = load_state(state_path)
+
+    if not state.get("db_id"):
+        dbid = os.getenv("NOTION_INCIDENT_LOG_DB_ID") or search_db_by_title(token, cfg["db_names"]["incident_log"])
+        if not dbid: raise SystemExit("Incident Log DB not found")
+        state = {"db_id": dbid, "cursor": None, "seen": []}
+        if not args.backfill:
+            # start from the newest existing incident instead of alerting the whole history
+            page = latest_incident(token, dbid)
+            if page:
+                advance(state, page)
+        save_state(state_path, state)
+        print("Watcher initialized at:", state["cursor"] or "start")
+
+    while True:
+        sent = poll(token, state, state_path)
+        if not sent:
+            print("No new incidents")
+        if not args.interval:
+            return
+        time.sleep(args.interval)
+
 if __name__ == "__main__":
     main()
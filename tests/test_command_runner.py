@@ -0,0 +1,57 @@
+import os, sys
+import pytest
+
+os.environ.setdefault("NOTION_TOKEN", "test")  # the module builds a client at import; no request is made
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "notion", "ops"))
+import command_runner as cr  # noqa: E402
+
+DB = "db1"
+
+def nodes(address, page_id=None):
+    """Partition nodes as run_batch builds them: the logical address, plus the page it resolved to."""
+    return [(DB, address)] + ([("page", page_id)] if page_id else [])
+
+@pytest.mark.parametrize("keyed, expected", [
+    # archive, then re-add of the same key: the add resolves to no page, yet stays with the archive
+    ([(nodes("Key:a", "p1"), "archive a"), (nodes("Key:a"), "re-add a"), (nodes("Key:a"), "update a")],
+     [["archive a", "re-add a", "update a"]]),
+    # one page reached through its key and through its title shares a partition
+    ([(nodes("Key:a", "p1"), "by key"), (nodes("title:A", "p1"), "by title")],
+     [["by key", "by title"]]),
+    # different pages run apart, each in file order
+    ([(nodes("Key:a", "p1"), "a1"), (nodes("Key:b", "p2"), "b1"), (nodes("Key:a", "p1"), "a2")],
+     [["a1", "a2"], ["b1"]]),
+    # a command linking two groups (key b now resolves to a's page) merges them, in file order
+    ([(nodes("Key:a", "p1"), "a"), (nodes("Key:b", "p2"), "b"), (nodes("Key:b", "p1"), "b on p1")],
+     [["a", "b", "b on p1"]]),
+])
+def test_partitions(keyed, expected):
+    assert cr.partitions(keyed) == expected
+
+def add(**props): return {"action": "add_page", "db": "Tasks", "properties": props}
+def update(**props): return {"action": "update_page", "db": "Tasks", "properties": props}
+def upsert(**props): return {"action": "upsert_page", "db": "Tasks", "key": "Key", "properties": props}
+def archive(key): return {"action": "delete_page", "db": "Tasks", "where": {"Key": key}}
+
+@pytest.mark.parametrize("cmds, expected", [
+    # add -> update -> update: one create carrying the latest values
+    ([add(Key="a", S="1"), update(Key="a", S="2"), update(Key="a", T="x")],
+     [([0, 1, 2], "add_page", {"Key": "a", "S": "2", "T": "x"})]),
+    # update -> archive: only the archive is written
+    ([update(Key="a", S="1"), archive("a")],
+     [([0, 1], "delete_page", None)]),
+    # add -> archive: the page is never created, nothing is written
+    ([add(Key="a"), archive("a")], []),
+    # archive -> re-add -> update: the archive stands, the re-add absorbs the update
+    ([archive("a"), add(Key="a", S="1"), update(Key="a", S="2")],
+     [([0], "delete_page", None), ([1, 2], "add_page", {"Key": "a", "S": "2"})]),
+    # update -> upsert: merged into one upsert
+    ([update(Key="a", S="1"), upsert(Key="a", T="x")],
+     [([0, 1], "upsert_page", {"Key": "a", "S": "1", "T": "x"})]),
+    # upsert -> archive: the upsert may create the page, so both are written
+    ([upsert(Key="a"), archive("a")],
+     [([0], "upsert_page", {"Key": "a"}), ([1], "delete_page", None)]),
+])
+def test_coalesce(cmds, expected):
+    out = cr.coalesce([("batch", i, cmd) for i, cmd in enumerate(cmds)])
+    assert [(positions, cmd["action"], cmd.get("properties")) for _, positions, cmd in out] == expected
@@ -0,0 +1,48 @@
+import os, sys
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+import ifns_sync  # noqa: E402
+
+def notion_page(props):
+    """The shape databases.query returns for the properties we sent."""
+    out = {}
+    for name, frag in props.items():
+        t = next(iter(frag))
+        v = frag[t]
+        if t in ("title", "rich_text"):
+            v = [{"type": "text", "plain_text": r["text"]["content"], "text": r["text"]} for r in v]
+        elif t == "date":
+            start = v["start"]
+            v = {"start": start + ".000+00:00" if "T" in start else start, "end": None, "time_zone": None}
+        elif t == "number" and v is not None and float(v).is_integer():
+            v = int(v)
+        out[name] = {"id": name[:4], "type": t, t: v}
+    return out
+
+def test_key_and_signature_round_trip_notion_shape():
+    df = pd.DataFrame({"Run Timestamp": ["2024-03-01T10:15:00", "2024-03-02"],
+                       "Capital": ["100000", "2,500.5"], "Status": ["Done", "Open"]})
+    types = {"Run Timestamp": "title", "Capital": "number", "Status": "select"}
+    types_dated = dict(types, **{"Run Timestamp": "date"})
+    cols = list(df.columns)
+    for keys, t in ((["Run Timestamp"], types), (["Status", "Run Timestamp"], types_dated)):
+        for local in ifns_sync.build_properties(df, t):
+            remote = notion_page(local)
+            assert ifns_sync.row_key(local, keys) == ifns_sync.row_key(remote, keys)
+            assert ifns_sync.signature(local, cols) == ifns_sync.signature(remote, cols)
+
+def test_canonical_date():
+    assert ifns_sync.canonical_date("2024-03-01T10:15:00") == ifns_sync.canonical_date("2024-03-01T10:15:00.000+00:00")
+    assert ifns_sync.canonical_date("2024-03-01T12:15:00+02:00") == "2024-03-01T10:15:00+00:00"
+    assert ifns_sync.canonical_date("2024-03-01") == "2024-03-01"
+
+def test_mixed_date_formats_convert_like_they_infer():
+    s = pd.Series(["2024-03-01", "2024-03-01 10:15"], name="Run Timestamp")
+    assert ifns_sync.infer_types(s.to_frame())["Run Timestamp"] == "date"
+    assert [f["date"]["start"] for f in ifns_sync.column_fragments(s, "date")] == ["2024-03-01T00:00:00", "2024-03-01T10:15:00"]
+
+def test_inference_checks_the_whole_column():
+    df = pd.DataFrame({"Qty": ["1"] * 1500 + ["pending"], "Detected": ["yes"] * 1500 + ["maybe"]})
+    types = ifns_sync.infer_types(df)
+    assert types["Qty"] != "number" and types["Detected"] != "checkbox"